@@ -29,10 +29,11 @@ def add_column_if_not_exists(engine, table_name, column_name, column_type):
         print(f"Error processing '{column_name}': {e}")
 
 if __name__ == "__main__":
-    print("Starting Widget table migration...")
+    print("Starting table migration...")
     try:
         add_column_if_not_exists(engine, "widgets", "height", "VARCHAR DEFAULT '1'")
         add_column_if_not_exists(engine, "widgets", "icon", "VARCHAR")
+        add_column_if_not_exists(engine, "thingsboard_profiles", "tb_created_time", "BIGINT")
         print("Migration complete.")
     except Exception as e:
         print(f"Migration script failed: {e}")
@@ -0,0 +1,270 @@
+"""
+Bulk ThingsBoard operations run as tracked jobs.
+
+A job pushes items from an async source through a fixed number of worker
+coroutines; every TB call they make first takes a token from a shared
+token bucket, so a large tenant cannot flood TB. A job runs in the worker
+process that started it, but its status, counts and errors live in the
+bulk_jobs table (written every TB_BULK_PROGRESS_INTERVAL seconds), so
+/tb/jobs gives the same answer on every worker and after restarts.
+Cancelling sets cancel_requested on the row; the running worker sees it at
+its next progress write. A job whose worker stopped writing progress for
+TB_BULK_STALE_AFTER seconds is closed as failed.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from . import models
+from .database import SessionLocal
+
+BULK_WORKERS = int(os.getenv("TB_BULK_WORKERS", "8"))
+BULK_RATE = float(os.getenv("TB_BULK_RATE", "20"))  # TB calls per second across all bulk jobs
+PROGRESS_INTERVAL = float(os.getenv("TB_BULK_PROGRESS_INTERVAL", "2"))
+STALE_AFTER = int(os.getenv("TB_BULK_STALE_AFTER", "300"))
+MAX_LISTED_JOBS = 200
+MAX_JOB_ERRORS = 100  # per job; further errors are only counted
+UNFINISHED = ("queued", "running")
+INTERRUPTED = "Interrupted, the worker running it stopped"
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+class BulkJob:
+    """A job running in this process; its bulk_jobs row mirrors it."""
+
+    def __init__(self, kind, tenant_id=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.tenant_id = tenant_id
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.created_at = utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.counts = {"processed": 0, "succeeded": 0, "failed": 0, "skipped": 0}
+        self.errors = []
+        self.detail = None
+        self.task = None
+        self.stopping = False  # set when the worker shuts down
+
+    def record(self, outcome, item_id=None, error=None):
+        """outcome is "succeeded", "failed" or "skipped"."""
+        self.counts["processed"] += 1
+        self.counts[outcome] += 1
+        if error and len(self.errors) < MAX_JOB_ERRORS:
+            self.errors.append({"id": item_id, "error": error})
+
+    def row_values(self):
+        return {
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "heartbeat_at": utcnow(),
+            "errors": json.dumps(self.errors),
+            "detail": self.detail,
+            **self.counts,
+        }
+
+
+rate_limiter = TokenBucket(BULK_RATE)
+_local = {}  # id -> BulkJob running in this process
+
+
+def to_dict(row):
+    return {
+        "id": row.id,
+        "kind": row.kind,
+        "tenant_id": row.tenant_id,
+        "status": row.status,
+        "worker": row.worker,
+        "created_at": row.created_at,
+        "started_at": row.started_at,
+        "finished_at": row.finished_at,
+        "counts": {
+            "processed": row.processed or 0,
+            "succeeded": row.succeeded or 0,
+            "failed": row.failed or 0,
+            "skipped": row.skipped or 0,
+        },
+        "errors": json.loads(row.errors) if row.errors else [],
+        "detail": row.detail,
+        "cancel_requested": bool(row.cancel_requested),
+    }
+
+def _close_stale(db: Session):
+    """Jobs whose worker stopped writing progress (it died) are closed as failed."""
+    db.execute(
+        update(models.BulkJob)
+        .where(models.BulkJob.status.in_(UNFINISHED),
+               models.BulkJob.heartbeat_at < utcnow() - timedelta(seconds=STALE_AFTER))
+        .values(status="failed", finished_at=utcnow(), detail=INTERRUPTED)
+    )
+    db.commit()
+
+def get_job(db: Session, job_id: str):
+    _close_stale(db)
+    row = db.get(models.BulkJob, job_id)
+    return to_dict(row) if row else None
+
+def list_jobs(db: Session):
+    _close_stale(db)
+    rows = db.query(models.BulkJob).order_by(models.BulkJob.created_at.desc()).limit(MAX_LISTED_JOBS)
+    return [to_dict(r) for r in rows]
+
+def cancel(db: Session, job_id: str):
+    """Request cancellation of a queued or running job; False if it does not exist or already finished."""
+    requested = db.execute(
+        update(models.BulkJob)
+        .where(models.BulkJob.id == job_id, models.BulkJob.status.in_(UNFINISHED))
+        .values(cancel_requested=True)
+    ).rowcount
+    db.commit()
+    return requested == 1
+
+def _insert(job):
+    db = SessionLocal()
+    try:
+        db.add(models.BulkJob(
+            id=job.id, kind=job.kind, tenant_id=job.tenant_id, status=job.status, worker=WORKER_ID,
+            created_at=job.created_at, heartbeat_at=job.created_at, errors="[]",
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+def _save(job):
+    """Write the job's progress to its row -> True if cancellation was requested."""
+    db = SessionLocal()
+    try:
+        db.execute(update(models.BulkJob).where(models.BulkJob.id == job.id).values(**job.row_values()))
+        db.commit()
+        return bool(db.query(models.BulkJob.cancel_requested).filter(models.BulkJob.id == job.id).scalar())
+    finally:
+        db.close()
+
+def entity_id(item):
+    """Id of a TB entity ({"id": {"id": ...}}), or None for anything else."""
+    try:
+        return item["id"]["id"]
+    except (KeyError, TypeError, IndexError):
+        return None
+
+async def submit(job, items, handle, workers=None, item_id=entity_id):
+    """Store `job` and start it on the running loop.
+
+    items:   async iterator of items (e.g. TB users), consumed as the workers catch up
+    handle:  async callable(job, item) -> None that records the item's outcome on the job;
+             it should await rate_limiter.acquire() before each TB call
+    item_id: callable(item) -> id recorded with the error if `handle` raises
+    """
+    await run_in_threadpool(_insert, job)
+    _local[job.id] = job
+    job.task = asyncio.get_running_loop().create_task(_run(job, items, handle, workers or BULK_WORKERS, item_id))
+    job.task.add_done_callback(lambda _: _local.pop(job.id, None))
+    return job
+
+async def _watch(job):
+    """Write progress every PROGRESS_INTERVAL seconds; cancel the job once that was requested."""
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        try:
+            if await run_in_threadpool(_save, job):
+                job.task.cancel()
+                return
+        except Exception as e:
+            print(f"Failed to save progress of bulk job {job.id}: {e}")
+
+async def _run(job, items, handle, workers, item_id):
+    queue = asyncio.Queue(maxsize=workers * 2)
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                await handle(job, item)
+            except Exception as e:
+                # One bad item must not stop the worker, or the producer would block forever
+                job.record("failed", item_id(item), str(e) or type(e).__name__)
+            finally:
+                queue.task_done()
+
+    pool = []
+    watcher = None
+    try:
+        job.status = "running"
+        job.started_at = utcnow()
+        if await run_in_threadpool(_save, job):  # cancelled while queued
+            raise asyncio.CancelledError()
+        watcher = asyncio.create_task(_watch(job))
+        pool = [asyncio.create_task(worker()) for _ in range(workers)]
+        async for item in items:
+            await queue.put(item)
+        for _ in pool:
+            await queue.put(None)
+        await asyncio.gather(*pool)
+        job.status = "done"
+    except asyncio.CancelledError:
+        if job.stopping:
+            job.status, job.detail = "failed", INTERRUPTED
+        else:
+            job.status = "cancelled"
+    except Exception as e:
+        job.status = "failed"
+        job.detail = str(e)
+    finally:
+        for t in pool:
+            t.cancel()
+        if watcher is not None:
+            watcher.cancel()
+        job.finished_at = utcnow()
+        print(f"Bulk job {job.id} ({job.kind}, tenant {job.tenant_id}) {job.status}: {job.counts}")
+        try:
+            await run_in_threadpool(_save, job)
+        except Exception as e:
+            print(f"Failed to store the result of bulk job {job.id}: {e}")
+
+async def stop():
+    """Shutdown: stop the jobs of this process and close their rows as failed."""
+    running = list(_local.values())
+    for job in running:
+        job.stopping = True
+        job.task.cancel()
+    await asyncio.gather(*(job.task for job in running), return_exceptions=True)
+    for job in running:
+        if job.finished_at is None:  # cancelled before it started
+            job.status, job.detail, job.finished_at = "failed", INTERRUPTED, utcnow()
+            await run_in_threadpool(_save, job)
@@ -0,0 +1,62 @@
+"""
+Bulk insert-or-update of rows keyed by a unique column.
+
+On PostgreSQL and SQLite a batch is written with one
+INSERT ... ON CONFLICT (key) DO UPDATE per chunk. Other databases load the
+existing rows of the batch with one SELECT ... WHERE key IN (...) and
+update them through the ORM. Either way a batch costs a handful of
+statements instead of a SELECT per row.
+"""
+import sqlite3
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+# Largest multi-row INSERT per statement; bound parameters per statement are limited as well
+MAX_CHUNK_ROWS = 1000
+MAX_PARAMS = {
+    "postgresql": 65535,
+    "sqlite": 32766 if sqlite3.sqlite_version_info >= (3, 32) else 999,
+}
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def upsert_rows(db: Session, model, key: str, rows):
+    """Insert `rows` (dicts of column values, all with the same columns) or update the rows with the same `key`.
+
+    Does not commit. If a key repeats within `rows` the last one wins.
+    """
+    rows = list({row[key]: row for row in rows if row.get(key) is not None}.values())
+    if not rows:
+        return 0
+    dialect = db.get_bind().dialect.name
+    if dialect in _INSERTS:
+        _upsert_on_conflict(db, model, key, rows, dialect)
+    else:
+        _upsert_prefetched(db, model, key, rows)
+    return len(rows)
+
+def _upsert_on_conflict(db, model, key, rows, dialect):
+    columns = list(rows[0])
+    chunk = max(1, min(MAX_CHUNK_ROWS, MAX_PARAMS[dialect] // len(columns)))
+    for i in range(0, len(rows), chunk):
+        stmt = _INSERTS[dialect](model.__table__).values(rows[i:i + chunk])
+        changes = {c: stmt.excluded[c] for c in columns if c != key}
+        # Column onupdate defaults are not applied to ON CONFLICT updates
+        if "updated_at" in model.__table__.c and "updated_at" not in changes:
+            changes["updated_at"] = func.now()
+        db.execute(stmt.on_conflict_do_update(index_elements=[key], set_=changes))
+
+def _upsert_prefetched(db, model, key, rows):
+    key_column = getattr(model, key)
+    keys = [row[key] for row in rows]
+    existing = {}
+    for i in range(0, len(keys), MAX_CHUNK_ROWS):
+        existing.update((getattr(r, key), r) for r in db.query(model).filter(key_column.in_(keys[i:i + MAX_CHUNK_ROWS])))
+    for row in rows:
+        obj = existing.get(row[key])
+        if obj is None:
+            db.add(model(**row))
+        else:
+            for column, value in row.items():
+                setattr(obj, column, value)
@@ -1,9 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .database import engine, Base
 from .routers import auth, tb, projects, admin, zoho, teams, widgets
 from . import auth as auth_utils # To create initial admin
+from .thingsboard import ThingsBoardError
+from . import tb_memo
+from .tb_breaker import CircuitOpenError
 import os
 
 # Base.metadata.create_all(bind=engine) # Moved to startup_event with retries
@@ -35,8 +39,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-TB-Dedup-Saved", "X-Tenants-Age"],
 )
 
+# Identical ThingsBoard GETs within one request are served once (see tb_memo)
+@app.middleware("http")
+async def tb_request_memo(request: Request, call_next):
+    memo, reset_token = tb_memo.begin()
+    try:
+        response = await call_next(request)
+    finally:
+        tb_memo.end(memo, reset_token)
+    if memo.saved:
+        response.headers["X-TB-Dedup-Saved"] = str(memo.saved)
+    return response
+
+# Incomplete ThingsBoard reads surface as a gateway error instead of a truncated list
+@app.exception_handler(ThingsBoardError)
+async def thingsboard_error_handler(request: Request, exc: ThingsBoardError):
+    print(f"ThingsBoard error on {request.url.path}: {exc}")
+    return JSONResponse(status_code=502, content={"detail": str(exc), "failed_pages": exc.failed_pages})
+
+# TB is known to be down: fail fast instead of an unhandled error
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 app.include_router(auth.router, prefix="/api")
 app.include_router(tb.router, prefix="/api")
 app.include_router(projects.router, prefix="/api")
@@ -92,6 +120,24 @@ def startup_event():
         db.close()
 
 
+@app.on_event("startup")
+async def start_background_sync():
+    from . import tenant_sync, scheduler, zoho_client
+    tenant_sync.start()
+    scheduler.start()
+    zoho_client.get_client()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    from . import thingsboard_async, tenant_sync, scheduler, zoho_client, bulk_jobs
+    await scheduler.stop()
+    await bulk_jobs.stop()
+    await tenant_sync.stop()
+    await thingsboard_async.close_client()
+    await zoho_client.close_client()
+
+
 @app.get("/api/api_health")
 def read_root():
     return {"message": "Welcome to Nibiaa Manager API"}
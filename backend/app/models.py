@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, DateTime, Text, Float
+from sqlalchemy import Boolean, Column, Integer, BigInteger, String, ForeignKey, DateTime, Text, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -191,6 +191,19 @@ class ZohoCustomer(Base):
     updated_time = Column(String, nullable=True)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+class ZohoToken(Base):
+    __tablename__ = "zoho_tokens"
+
+    id = Column(Integer, primary_key=True) # single row, id 1, shared by all workers
+    refresh_token = Column(Text, nullable=True)
+    access_token = Column(Text, nullable=True)
+    expires_at = Column(Float, default=0) # epoch seconds
+    dc = Column(String, nullable=True) # accounts DC that issued the tokens, e.g. "in"
+    api_domain = Column(String, nullable=True)
+    lease_owner = Column(String, nullable=True) # host:pid of the worker refreshing right now
+    lease_until = Column(Float, default=0) # epoch seconds
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class PlanProfileMapping(Base):
     __tablename__ = "plan_profile_mappings"
 
@@ -206,8 +219,77 @@ class ThingsboardProfile(Base):
     name = Column(String, index=True)
     description = Column(Text, nullable=True)
     is_default = Column(Boolean, default=False)
+    tb_created_time = Column(BigInteger, nullable=True) # createdTime reported by TB, changes when a profile is re-created
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class TenantPrimaryAdmin(Base):
+    __tablename__ = "tenant_primary_admins"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String, unique=True, index=True) # ThingsBoard Tenant ID
+    tb_user_id = Column(String) # First created TENANT_ADMIN, used for impersonation
+    email = Column(String, nullable=True)
+    created_time = Column(BigInteger, nullable=True) # TB createdTime (ms)
+    verified_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def as_tb_user(self):
+        """Minimal TB user dict, shaped like the entries of /api/tenant/{id}/users."""
+        return {
+            "id": {"id": self.tb_user_id, "entityType": "USER"},
+            "tenantId": {"id": self.tenant_id, "entityType": "TENANT"},
+            "email": self.email,
+            "authority": "TENANT_ADMIN",
+            "createdTime": self.created_time,
+        }
+
+class Tenant(Base):
+    __tablename__ = "tenants"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String, unique=True, index=True) # ThingsBoard Tenant ID
+    title = Column(String, index=True)
+    tenant_profile_id = Column(String, nullable=True)
+    created_time = Column(BigInteger, index=True) # TB createdTime (ms)
+    data = Column(Text) # Tenant as returned by TB (JSON)
+    synced_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ScheduledJob(Base):
+    __tablename__ = "scheduled_jobs"
+    # The dispatcher only ever looks for due pending jobs
+    __table_args__ = (Index("ix_scheduled_jobs_status_run_at", "status", "run_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String) # e.g. deactivate_tenant_users
+    tenant_id = Column(String, index=True, nullable=True) # ThingsBoard Tenant ID
+    run_at = Column(DateTime(timezone=True))
+    status = Column(String, default="pending") # pending, running, done, failed, cancelled
+    created_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    claimed_by = Column(String, nullable=True) # host:pid of the worker that ran it
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    result = Column(Text, nullable=True) # JSON summary of the run or the error
+
+class BulkJob(Base):
+    __tablename__ = "bulk_jobs"
+
+    id = Column(String, primary_key=True, index=True) # uuid hex
+    kind = Column(String) # activate, deactivate
+    tenant_id = Column(String, index=True, nullable=True) # ThingsBoard Tenant ID
+    status = Column(String, default="queued") # queued, running, done, failed, cancelled
+    worker = Column(String, nullable=True) # host:pid of the worker running it
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True) # last progress write of the running worker
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    processed = Column(Integer, default=0)
+    succeeded = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)
+    errors = Column(Text, nullable=True) # JSON list of {"id", "error"}
+    detail = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, default=False) # polled by the running worker
+
 class Team(Base):
     __tablename__ = "teams"
 
@@ -2,8 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile,
 from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
-from .. import database, models, schemas, auth, thingsboard
+from .. import database, models, schemas, auth
+from ..tb_tokens import system_tokens
 from .zoho import sync_zoho_data
 from ..email_utils import send_activation_email, send_reset_password_email
 import shutil
@@ -31,9 +33,8 @@ async def login_for_access_token(
     if local_valid:
         # Local login successful - Use System TB Credentials
         # Nibiaa Manager users are standalone, so we use the configured TB Admin account for API access.
-        tb_username = os.getenv("TB_USERNAME", "admin@nibiaa.com")
-        tb_password = os.getenv("TB_PASSWORD", "122333")
-        tb_data = thingsboard.tb_login(tb_username, tb_password)
+        # The token is shared process-wide and only renewed when it is about to expire.
+        tb_data = await run_in_threadpool(system_tokens.get_tokens)
         tb_token = tb_data["token"] if tb_data else None
         tb_refresh_token = tb_data["refreshToken"] if tb_data else None
     else:
@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Body, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Header, Body, Response
 from typing import List, Optional
 import asyncio
+import time
+from datetime import timedelta
+from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
-from .. import schemas, thingsboard, auth, models, database
+from fastapi.concurrency import run_in_threadpool
+from .. import schemas, thingsboard, auth, models, database, tenant_admins, tb_profiles, tenant_sync, tenant_reconcile, bulk_jobs, scheduler
+from .. import thingsboard_async as tb_async
+from ..tb_tokens import system_tokens
+from ..tb_cache import SWRCache
+from .. import tb_memo, tb_breaker
 
 router = APIRouter(prefix="/tb", tags=["ThingsBoard"])
 
@@ -12,52 +20,166 @@ def get_tb_token(x_tb_token: str = Header(None)):
         raise HTTPException(status_code=400, detail="X-TB-Token header missing")
     return x_tb_token
 
-# Helper to aggregate users
-def _get_tenant_users_aggregated(tenant_id: str, token: str):
-    # 1. Try to get Tenant Admin token
-    ta_token = None
-    users = thingsboard.get_tenant_users(token, tenant_id)
-    
+async def _impersonate_primary_admin(db: Session, tenant_id: str, token: str):
+    """Token of the tenant's primary (first created) Tenant Admin -> (tenant_admin, ta_token).
+
+    The admin comes from the tenant_primary_admins index; the tenant's users are
+    only listed when there is no entry yet or TB no longer issues a token for it.
+    """
+    # The blocking Session calls run in the threadpool, not on the event loop
+    mapping = await run_in_threadpool(tenant_admins.get_primary_admin, db, tenant_id)
+    if mapping:
+        ta_token = await tb_async.get_user_token(token, mapping.tb_user_id)
+        if ta_token:
+            return mapping.as_tb_user(), ta_token
+        print(f"Stored primary admin {mapping.tb_user_id} of tenant {tenant_id} is no longer usable, re-resolving")
+        await run_in_threadpool(tenant_admins.forget_primary_admin, db, tenant_id)
+
+    ta = await tb_async.get_first_tenant_admin(token, tenant_id)
+    if not ta:
+        return None, None
+    await run_in_threadpool(tenant_admins.remember_primary_admin, db, tenant_id, ta)
+    return ta, await tb_async.get_user_token(token, ta['id']['id'])
+
+async def _resolve_tenant_admin(db: Session, tenant_id: str, token: str):
+    """Find the Tenant Admin to act as for tenant_id -> (tenant_admin, ta_token).
+
+    The caller's own token is used when it already belongs to a Tenant Admin of
+    the tenant, otherwise the primary Tenant Admin is impersonated.
+    """
     # Check if caller is already a Tenant Admin for this tenant
-    caller = thingsboard.get_current_tb_user(token)
+    caller = await tb_async.get_current_tb_user(token)
     if caller and caller.get('authority') == 'TENANT_ADMIN' and caller.get('tenantId', {}).get('id') == tenant_id:
-        ta_token = token
-        # Identify 'ta' for return
-        ta = caller
-    else:
-        # Find the first created Tenant Admin (Oldest First)
-        tenant_admins = [u for u in users if u['authority'] == 'TENANT_ADMIN']
-        tenant_admins.sort(key=lambda x: x.get('createdTime', float('inf')))
-        
-        ta = tenant_admins[0] if tenant_admins else None
-        if ta:
-            ta_token = thingsboard.get_user_token(token, ta['id']['id'])
+        return caller, token
+    return await _impersonate_primary_admin(db, tenant_id, token)
+
+# Enrichment calls made / skipped by tenant user loads since start, for /tb/client/stats
+enrichment_totals = {"loads": 0, "users": 0, "calls": 0, "skipped": 0, "errors": 0}
+
+# Helper to aggregate users
+async def _get_tenant_users_aggregated(db: Session, tenant_id: str, token: str, details: bool = True, credentials: bool = True):
+    timings = {}
+    phase_started = time.perf_counter()
+
+    def phase_done(name):
+        nonlocal phase_started
+        now = time.perf_counter()
+        timings[name] = int((now - phase_started) * 1000)
+        phase_started = now
+
+    # 1. Try to get Tenant Admin token
+    ta, ta_token = await _resolve_tenant_admin(db, tenant_id, token)
+    phase_done("resolve_admin")
     
     if ta_token:
-        all_users = thingsboard.get_all_user_infos(ta_token)
+        # Not get_all_user_infos: everything is enriched once, after the merge
+        all_users = await tb_async.fetch_all_pages(ta_token, "/api/userInfos/all")
+        user_map = {u['id']['id']: u for u in all_users}
+        phase_done("user_infos")
         
         # Manual aggregation
-        direct_users = thingsboard.get_tenant_admins(ta_token)
-        customers = thingsboard.get_customers(ta_token)
-        customer_users = []
-        for c in customers:
-            c_users = thingsboard.get_customer_users(ta_token, c['id']['id'])
-            customer_users.extend(c_users)
-            
-        # Merge lists
-        user_map = {u['id']['id']: u for u in all_users}
+        direct_users = await tb_async.get_tenant_admins(ta_token)
         for u in direct_users:
             user_map[u['id']['id']] = u
-        for u in customer_users:
-            user_map[u['id']['id']] = u
+        phase_done("tenant_admins")
+
+        customers = await tb_async.get_customers(ta_token)
+        phase_done("customers")
+
+        # Customer users are listed concurrently and merged as each customer finishes
+        async for _, c_users in tb_async.iter_customer_users(ta_token, customers):
+            for u in c_users:
+                user_map[u['id']['id']] = u
+        phase_done("customer_users")
             
         final_users = list(user_map.values())
         
-        # Enrich with details
-        final_users = thingsboard.enrich_users_with_details(ta_token, final_users)
+        # Enrich with details / credential state, as requested
+        enrichment = {}
+        if details or credentials:
+            final_users = await tb_async.enrich_users_with_details(ta_token, final_users, stats=enrichment, details=details, credentials=credentials)
+            phase_done("enrich")
+            enrichment_totals["loads"] += 1
+            for key, value in enrichment.items():
+                enrichment_totals[key] += value
+        print(f"Aggregated {len(final_users)} users of tenant {tenant_id} ({len(customers)} customers), ms per phase: {timings}, enrichment: {enrichment}")
         return final_users, ta
     else:
-        return users, None
+        return await tb_async.get_tenant_users(token, tenant_id), None
+
+# Aggregated tenant users keyed by (tenant_id, details, credentials), grouped per tenant
+tenant_users_cache = SWRCache(thingsboard.TENANT_USERS_CACHE_SIZE, thingsboard.TENANT_USERS_FRESH_TTL, thingsboard.TENANT_USERS_MAX_STALE)
+
+async def _check_tenant_access(tenant_id: str, token: str):
+    """Raise unless the caller's TB account is a System Admin or a Tenant Admin of tenant_id."""
+    caller = await tb_async.get_current_tb_user(token)
+    if not caller:
+        raise HTTPException(status_code=401, detail="Invalid or expired ThingsBoard token")
+    if caller.get('authority') == 'SYS_ADMIN':
+        return
+    if caller.get('authority') == 'TENANT_ADMIN' and caller.get('tenantId', {}).get('id') == tenant_id:
+        return
+    raise HTTPException(status_code=403, detail="Not allowed to view the users of this tenant")
+
+async def _get_tenant_users_cached(tenant_id: str, token: str, details: bool = True, credentials: bool = True):
+    """_get_tenant_users_aggregated behind tenant_users_cache.
+
+    Entries are shared by every caller, so the caller's token is checked
+    first: only a System Admin or a Tenant Admin of the tenant gets them.
+    Loads may finish in the background after the request is gone, so they
+    use their own DB session, and they authenticate with the current system
+    token (the tenant admin is impersonated from it) rather than the token
+    of whichever request first created the entry, which may have expired
+    since. The caller's token is only used if the system login fails.
+    """
+    await _check_tenant_access(tenant_id, token)
+
+    async def load():
+        load_token = await run_in_threadpool(system_tokens.get_token) or token
+        db = database.SessionLocal()
+        try:
+            return await _get_tenant_users_aggregated(db, tenant_id, load_token, details, credentials)
+        finally:
+            db.close()
+    return await tenant_users_cache.get((tenant_id, details, credentials), load, group=tenant_id)
+
+async def _iter_tenant_users(tenant_id: str, token: str, ta_token: Optional[str]):
+    """Stream the same users as _get_tenant_users_aggregated, page by page and without enrichment.
+
+    Every user is yielded once; only the set of seen ids is kept in memory.
+    """
+    seen = set()
+
+    def unseen(page):
+        fresh = [u for u in page if u['id']['id'] not in seen]
+        seen.update(u['id']['id'] for u in fresh)
+        return fresh
+
+    if not ta_token:
+        async for page in tb_async.iter_pages(token, f"/api/tenant/{tenant_id}/users"):
+            yield unseen(page)
+        return
+
+    async for page in tb_async.iter_pages(ta_token, "/api/userInfos/all"):
+        yield unseen(page)
+    async for page in tb_async.iter_pages(ta_token, "/api/users", {"sortProperty": "createdTime", "sortOrder": "DESC"}):
+        yield unseen(page)
+    async for customers in tb_async.iter_pages(ta_token, "/api/customers"):
+        async for _, c_users in tb_async.iter_customer_users(ta_token, customers):
+            yield unseen(c_users)
+
+@router.get("/client/stats")
+def get_client_stats(current_user: models.User = Depends(auth.require_role(["owner", "co_owner"]))):
+    return {
+        "pool": thingsboard.get_pool_stats(),
+        "system_token": system_tokens.stats(),
+        "impersonation_tokens": thingsboard.impersonation_tokens.stats(),
+        "tenant_users": tenant_users_cache.stats(),
+        "enrichment": enrichment_totals,
+        "request_memo": tb_memo.totals,
+        "circuit": tb_breaker.stats(),
+        "current_users": thingsboard.current_users.stats(),
+    }
 
 @router.post("/login")
 def login_tb(creds: schemas.LoginRequest):
@@ -75,84 +197,109 @@ def refresh_tb_token(refresh_token: str = Body(..., embed=True)):
 
 @router.post("/auth/logout")
 def logout_tb(token: str = Depends(get_tb_token)):
-    thingsboard.tb_logout(token)
+    # A TB logout outdates every token of that account, including the shared
+    # system-admin token other sessions and server-side jobs are using.
+    if not system_tokens.owns(token):
+        thingsboard.tb_logout(token)
     return {"status": "logged out"}
 
+MAX_TENANT_PAGE_SIZE = 1000
+TENANT_SORT_COLUMNS = {"createdTime": models.Tenant.created_time, "title": models.Tenant.title}
+
 @router.get("/tenants")
 def get_tenants(
+    response: Response,
+    page: int = 0,
+    pageSize: int = 100,
+    sortProperty: str = "createdTime",
+    sortOrder: str = "DESC",
+    textSearch: Optional[str] = None,
+    refresh: bool = False,
     token: str = Depends(get_tb_token), 
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.require_role(["owner", "co_owner", "marketing", "developer"]))
 ):
-    all_tenants_tb = thingsboard.list_tenants(token)
-    
-    # --- SYNC: Delete local data for tenants that no longer exist in ThingsBoard ---
-    valid_tb_ids = [t['id']['id'] for t in all_tenants_tb]
-    
-    # 1. Identify orphaned projects
-    orphaned_projects_query = db.query(models.Project)
-    if valid_tb_ids:
-        orphaned_projects_query = orphaned_projects_query.filter(models.Project.tenant_id.notin_(valid_tb_ids))
-    else:
-        # If TB returns empty list (and it's not an error), then all local projects with tenant_id are orphaned
-        orphaned_projects_query = orphaned_projects_query.filter(models.Project.tenant_id != None)
-        
-    orphaned_projects = orphaned_projects_query.all()
-    
-    if orphaned_projects:
-        for proj in orphaned_projects:
-            # Delete associated tasks
-            db.query(models.Task).filter(models.Task.project_id == proj.id).delete()
-            # Delete the project
-            db.delete(proj)
-        db.commit()
-        
-    # 2. Identify orphaned UserTenant records
-    orphaned_ut_query = db.query(models.UserTenant)
-    if valid_tb_ids:
-        orphaned_ut_query = orphaned_ut_query.filter(models.UserTenant.tenant_id.notin_(valid_tb_ids))
-    else:
-        orphaned_ut_query = orphaned_ut_query.filter(models.UserTenant.tenant_id != None)
-        
-    if orphaned_ut_query.count() > 0:
-        orphaned_ut_query.delete(synchronize_session=False)
-        db.commit()
-    # -------------------------------------------------------------------------------
-
-    # Filter: Only show tenants that have a corresponding Project in local DB (Created by System)
-    # Query returns list of tuples like [('id1',), ('id2',)]
-    system_project_tenant_ids = [r[0] for r in db.query(models.Project.tenant_id).all()]
-    
-    # Keep only tenants that exist in our local Project table
-    system_tenants = [t for t in all_tenants_tb if t['id']['id'] in system_project_tenant_ids]
+    # Paged like TB's own list endpoints: page / pageSize / sortProperty / sortOrder / textSearch
+    if page < 0 or not 1 <= pageSize <= MAX_TENANT_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"page must be >= 0 and pageSize between 1 and {MAX_TENANT_PAGE_SIZE}")
+    sort_column = TENANT_SORT_COLUMNS.get(sortProperty)
+    if sort_column is None or sortOrder.upper() not in ("ASC", "DESC"):
+        raise HTTPException(status_code=400, detail=f"sortProperty must be one of {list(TENANT_SORT_COLUMNS)} and sortOrder ASC or DESC")
+
+    # Served from the local tenants table kept up to date by tenant_sync;
+    # ?refresh=true (or a table this process never filled) syncs it first.
+    if refresh or (tenant_sync.state["last_synced_at"] is None and db.query(models.Tenant.id).first() is None):
+        tenant_sync.sync_tenants(db, token)
+
+    # Only tenants that have a corresponding Project in local DB (Created by System) are shown
+    query = db.query(models.Tenant).filter(models.Tenant.tenant_id.in_(db.query(models.Project.tenant_id)))
 
     # If user is admin or co_admin, return all system tenants
-    if "owner" in current_user.role or "co_owner" in current_user.role:
-        return system_tenants
-        
-    # Filter for Technical Manager
-    if "developer" in current_user.role:
-        # Get tenant_ids assigned to this TM
-        tm_tenant_ids = [r[0] for r in db.query(models.Project.tenant_id).filter(models.Project.technical_manager_id == current_user.id).all()]
-        system_tenants = [t for t in system_tenants if t['id']['id'] in tm_tenant_ids]
-
-    # Filter for Project Manager
-    if "marketing" in current_user.role:
-        # Get tenant_ids assigned to this PM (via UserTenant or Project)
-        pm_tenant_ids = [r[0] for r in db.query(models.UserTenant.tenant_id).filter(models.UserTenant.user_id == current_user.id).all()]
-        pm_project_tenant_ids = [r[0] for r in db.query(models.Project.tenant_id).filter(models.Project.project_manager_id == current_user.id).all()]
-        
-        allowed_ids = set(pm_tenant_ids + pm_project_tenant_ids)
-        system_tenants = [t for t in system_tenants if t['id']['id'] in allowed_ids]
+    if not ("owner" in current_user.role or "co_owner" in current_user.role):
+        # Filter for Technical Manager
+        if "developer" in current_user.role:
+            tm_tenant_ids = db.query(models.Project.tenant_id).filter(models.Project.technical_manager_id == current_user.id)
+            query = query.filter(models.Tenant.tenant_id.in_(tm_tenant_ids))
+
+        # Filter for Project Manager (via UserTenant or Project)
+        if "marketing" in current_user.role:
+            pm_tenant_ids = db.query(models.UserTenant.tenant_id).filter(models.UserTenant.user_id == current_user.id)
+            pm_project_tenant_ids = db.query(models.Project.tenant_id).filter(models.Project.project_manager_id == current_user.id)
+            query = query.filter(or_(models.Tenant.tenant_id.in_(pm_tenant_ids), models.Tenant.tenant_id.in_(pm_project_tenant_ids)))
+
+    if textSearch:
+        query = query.filter(func.lower(models.Tenant.title).contains(textSearch.lower(), autoescape=True))
+
+    total = query.count()
+    order = sort_column.desc() if sortOrder.upper() == "DESC" else sort_column.asc()
+    rows = query.order_by(order, models.Tenant.tenant_id).offset(page * pageSize).limit(pageSize).all()
+
+    sync_status = tenant_sync.status()
+    if sync_status["age_seconds"] is not None:
+        response.headers["X-Tenants-Age"] = str(sync_status["age_seconds"])
+    return {
+        "data": [tenant_sync.to_tb_tenant(r) for r in rows],
+        "totalPages": (total + pageSize - 1) // pageSize,
+        "totalElements": total,
+        "hasNext": (page + 1) * pageSize < total,
+    }
+
+@router.get("/tenants/sync")
+def get_tenant_sync_status(current_user: models.User = Depends(auth.require_role(["owner", "co_owner", "marketing", "developer"]))):
+    return tenant_sync.status()
+
+@router.post("/tenants/sync")
+def sync_tenants(
+    token: str = Depends(get_tb_token),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.require_role(["owner", "co_owner"]))
+):
+    result = tenant_sync.sync_tenants(db, token)
+    return {**tenant_sync.status(), "last_result": result}
 
-    return system_tenants
+@router.post("/tenants/reconcile")
+def reconcile_tenants(
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.require_role(["owner", "co_owner"]))
+):
+    # Removes projects / user_tenants of tenants no longer in the synced tenants table
+    result = tenant_reconcile.reconcile_orphans(db)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Tenants have not been synced yet")
+    return result
 
 @router.get("/profiles")
-def get_profiles(token: str = Depends(get_tb_token), current_user: models.User = Depends(auth.require_role(["owner", "co_owner", "marketing", "developer"]))):
-    return thingsboard.get_tenant_profiles(token)
+def get_profiles(
+    refresh: bool = False,
+    token: str = Depends(get_tb_token),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.require_role(["owner", "co_owner", "marketing", "developer"]))
+):
+    # Served from the local mirror; ?refresh=true re-syncs it from TB first
+    return tb_profiles.list_profiles(db, token, refresh=refresh)
 
 @router.post("/users")
-def create_tb_user(
+async def create_tb_user(
     user: schemas.TBUserCreate, 
     token: str = Depends(get_tb_token), 
     current_user: models.User = Depends(auth.require_role(["owner", "co_owner", "marketing", "developer"]))
@@ -163,7 +310,7 @@ def create_tb_user(
         if current_user.role not in ["owner", "co_owner", "marketing"]:
              raise HTTPException(status_code=403, detail="Only Admins and Project Managers can invite Tenant Admins")
 
-    new_user = thingsboard.create_user(
+    new_user = await tb_async.create_user(
         token, 
         user.email, 
         user.firstName, 
@@ -174,20 +321,11 @@ def create_tb_user(
     )
     if not new_user:
         raise HTTPException(status_code=400, detail="Failed to create user in ThingsBoard")
+    # Customer users may be created without a tenant id, then every tenant's list is dropped
+    tenant_users_cache.invalidate((new_user.get('tenantId') or {}).get('id') or user.tenantId)
     return new_user
 
-@router.post("/tenants")
-def create_tenant(
-    tenant: schemas.TenantCreate, 
-    token: str = Depends(get_tb_token), 
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.require_role(["owner", "marketing"]))
-):
-    # Create Tenant
-    new_tenant = thingsboard.create_tenant(token, tenant.title, tenant.profile_id, tenant.use_case)
-    if not new_tenant:
-        raise HTTPException(status_code=400, detail="Failed to create tenant")
-    
+def _generated_admin_email(db: Session, tenant: schemas.TenantCreate):
     # Generate Admin Email
     # Format: technical_manager_name + tenant_name + @nibiaa.com
     tm_user = db.query(models.User).filter(models.User.id == tenant.technical_manager_id).first()
@@ -202,30 +340,20 @@ def create_tenant(
     clean_tenant_title = "".join(e for e in tenant.title if e.isalnum()).lower()
     
     generated_admin_email = f"{tm_name}+{clean_tenant_title}@nibiaa.com"
+    return generated_admin_email
 
-    # Create Admin
-    admin = thingsboard.create_tenant_admin(token, new_tenant['id']['id'], generated_admin_email, tenant.first_name, tenant.last_name)
-    
-    # Create Project in Local DB
-    # Automatically create a project for this tenant
-    
-    # Fetch Profile Name if profile_id is present
-    profile_name = None
-    if tenant.profile_id:
-        # We need to fetch profiles to find the name. 
-        # This is a bit inefficient but works.
-        profiles = thingsboard.get_tenant_profiles(token)
-        for p in profiles:
-            if p['id']['id'] == tenant.profile_id:
-                profile_name = p['name']
-                break
-    
+def _create_tenant_project(db: Session, tenant: schemas.TenantCreate, tenant_id: str, profile_name: Optional[str], current_user_id: int):
+    """Project, user_tenants and template tasks of a newly created tenant -> schemas.Project.
+
+    The project is serialized here, in the thread owning the session; the
+    last commit expired it, so reading it later would lazy-load on the event loop.
+    """
     db_project = models.Project(
         name=f"{tenant.title} Project",
         description=f"Project for managing tenant {tenant.title}",
-        tenant_id=new_tenant['id']['id'],
+        tenant_id=tenant_id,
         technical_manager_id=tenant.technical_manager_id,
-        project_manager_id=tenant.project_manager_id if tenant.project_manager_id else current_user.id,
+        project_manager_id=tenant.project_manager_id if tenant.project_manager_id else current_user_id,
         usecase=tenant.use_case,
         plan=profile_name,
         customer_email=tenant.customer_email,
@@ -240,12 +368,12 @@ def create_tenant(
 
     # Assign the creator (Project Manager) to this tenant
     # If project_manager_id is provided, assign that user. If not, assign current_user.
-    pm_id_to_assign = tenant.project_manager_id if tenant.project_manager_id else current_user.id
+    pm_id_to_assign = tenant.project_manager_id if tenant.project_manager_id else current_user_id
     
     # Check if assignment already exists (e.g. if current_user is the assigned PM)
-    existing_assignment = db.query(models.UserTenant).filter(models.UserTenant.user_id == pm_id_to_assign, models.UserTenant.tenant_id == new_tenant['id']['id']).first()
+    existing_assignment = db.query(models.UserTenant).filter(models.UserTenant.user_id == pm_id_to_assign, models.UserTenant.tenant_id == tenant_id).first()
     if not existing_assignment:
-        user_tenant = models.UserTenant(user_id=pm_id_to_assign, tenant_id=new_tenant['id']['id'])
+        user_tenant = models.UserTenant(user_id=pm_id_to_assign, tenant_id=tenant_id)
         db.add(user_tenant)
     
     # If current_user is NOT the assigned PM (e.g. Admin creating for a PM), maybe assign Admin too?
@@ -253,14 +381,14 @@ def create_tenant(
     
     # Also assign the Technical Manager to this tenant
     if tenant.technical_manager_id:
-        tm_assignment = db.query(models.UserTenant).filter(models.UserTenant.user_id == tenant.technical_manager_id, models.UserTenant.tenant_id == new_tenant['id']['id']).first()
+        tm_assignment = db.query(models.UserTenant).filter(models.UserTenant.user_id == tenant.technical_manager_id, models.UserTenant.tenant_id == tenant_id).first()
         if not tm_assignment:
-            tm_tenant = models.UserTenant(user_id=tenant.technical_manager_id, tenant_id=new_tenant['id']['id'])
+            tm_tenant = models.UserTenant(user_id=tenant.technical_manager_id, tenant_id=tenant_id)
             db.add(tm_tenant)
 
     # Assign the selected User if provided
     if tenant.assigned_user_id:
-        assigned_user_tenant = models.UserTenant(user_id=tenant.assigned_user_id, tenant_id=new_tenant['id']['id'])
+        assigned_user_tenant = models.UserTenant(user_id=tenant.assigned_user_id, tenant_id=tenant_id)
         db.add(assigned_user_tenant)
 
     # Create Tasks from Templates if provided
@@ -285,11 +413,53 @@ def create_tenant(
             db.add(zoho_tenant)
 
     db.commit()
+    db.refresh(db_project)
+    return schemas.Project.model_validate(db_project)
+
+@router.post("/tenants")
+async def create_tenant(
+    tenant: schemas.TenantCreate, 
+    token: str = Depends(get_tb_token), 
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.require_role(["owner", "marketing"]))
+):
+    # Create Tenant
+    new_tenant = await tb_async.create_tenant(token, tenant.title, tenant.profile_id, tenant.use_case)
+    if not new_tenant:
+        raise HTTPException(status_code=400, detail="Failed to create tenant")
+    
+    # DB work runs in the threadpool so it doesn't block other requests' TB calls
+    generated_admin_email = await run_in_threadpool(_generated_admin_email, db, tenant)
+
+    # Create Admin
+    await run_in_threadpool(tenant_sync.remember_tenant, db, new_tenant)
+
+    admin = await tb_async.create_tenant_admin(token, new_tenant['id']['id'], generated_admin_email, tenant.first_name, tenant.last_name)
+    if admin:
+        await run_in_threadpool(tenant_admins.remember_primary_admin, db, new_tenant['id']['id'], admin)
+    
+    # Create Project in Local DB
+    # Automatically create a project for this tenant
+    
+    # Profile name comes from the local profile mirror; only an unknown id triggers a re-sync
+    profile_name = None
+    if tenant.profile_id:
+        profile = await run_in_threadpool(tb_profiles.get_by_id, db, tenant.profile_id)
+        if not profile:
+            try:
+                await run_in_threadpool(tb_profiles.sync_profiles, db, token)
+            except thingsboard.ThingsBoardError as e:
+                print(f"Could not refresh tenant profiles: {e}")
+            profile = await run_in_threadpool(tb_profiles.get_by_id, db, tenant.profile_id)
+        if profile:
+            profile_name = profile['name']
+
+    project = await run_in_threadpool(_create_tenant_project, db, tenant, new_tenant['id']['id'], profile_name, current_user.id)
 
     if not admin:
-        return {"tenant": new_tenant, "project": db_project, "message": "Tenant and Project created but Admin creation failed"}
+        return {"tenant": new_tenant, "project": project, "message": "Tenant and Project created but Admin creation failed"}
     
-    return {"tenant": new_tenant, "owner": admin, "project": db_project}
+    return {"tenant": new_tenant, "owner": admin, "project": project}
 
 @router.put("/tenant/{tenant_id}")
 def update_tenant(
@@ -297,59 +467,137 @@ def update_tenant(
     title: str = Body(..., embed=True), 
     profile_id: str = Body(..., embed=True), 
     token: str = Depends(get_tb_token), 
+    db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.require_role(["owner", "marketing"]))
 ):
     updated_tenant = thingsboard.update_tenant(token, tenant_id, title, profile_id)
     if not updated_tenant:
         raise HTTPException(status_code=400, detail="Failed to update tenant")
+    tenant_sync.remember_tenant(db, updated_tenant)
     return updated_tenant
 
 @router.get("/tenant/{tenant_id}/users")
-def get_tenant_users(
+async def get_tenant_users(
     tenant_id: str, 
     token: str = Depends(get_tb_token), 
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.require_role(["marketing", "developer"]))
+    current_user: models.User = Depends(auth.require_role(["marketing", "developer"])),
+    details: bool = True,
+    credentials: bool = True,
+    refresh: bool = False
 ):
-    users, _ = _get_tenant_users_aggregated(tenant_id, token)
+    # details=false / credentials=false skip the per-user additionalInfo and credential lookups,
+    # the credential state can then be loaded separately via /users/credentials
+    if refresh:
+        tenant_users_cache.invalidate(tenant_id)
+    users, _ = await _get_tenant_users_cached(tenant_id, token, details, credentials)
     return users
 
-def _bulk_user_action_task(tenant_id: str, token: str, active: bool, ignore_domain_check: bool = False):
-    action_name = "activation" if active else "deactivation"
-    users, first_ta = _get_tenant_users_aggregated(tenant_id, token)
-    
-    count = 0
-    for u in users:
+MAX_CREDENTIAL_LOOKUP = 1000
+
+@router.post("/tenant/{tenant_id}/users/credentials")
+async def get_tenant_users_credentials(
+    tenant_id: str,
+    user_ids: List[str] = Body(..., embed=True),
+    token: str = Depends(get_tb_token),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.require_role(["marketing", "developer"]))
+):
+    """Credential state of a batch of tenant users -> {user_id: enabled}."""
+    if len(user_ids) > MAX_CREDENTIAL_LOOKUP:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_CREDENTIAL_LOOKUP} user ids per request")
+    _, ta_token = await _resolve_tenant_admin(db, tenant_id, token)
+    return await tb_async.get_credentials_enabled(ta_token or token, user_ids)
+
+async def _start_bulk_user_action(tenant_id: str, token: str, active: bool, ignore_domain_check: bool = False):
+    """Start a tracked bulk_jobs job toggling the credentials of a tenant's users -> BulkJob.
+
+    Users are streamed page by page into the job's worker pool; each toggle
+    waits for the shared bulk rate limiter.
+    """
+    job = bulk_jobs.BulkJob("activate" if active else "deactivate", tenant_id)
+    first_ta = None
+
+    async def users():
+        nonlocal first_ta
+        db = database.SessionLocal()
+        try:
+            first_ta, ta_token = await _resolve_tenant_admin(db, tenant_id, token)
+        finally:
+            db.close()
+        async for page in _iter_tenant_users(tenant_id, token, ta_token):
+            for u in page:
+                yield u
+
+    async def toggle(job, u):
+        user_id = u['id']['id']
         # Skip if email ends with @nibiaa.com UNLESS ignore_domain_check is True
         if not ignore_domain_check and u.get('email', '').endswith('@nibiaa.com'):
-            continue
-            
+            job.record("skipped", user_id)
+            return
         # Skip if it is the First Tenant Admin
-        if first_ta and u['id']['id'] == first_ta['id']['id']:
-            continue
-            
-        # Toggle
-        thingsboard.toggle_user_credentials(token, u['id']['id'], active)
-        count += 1
+        if first_ta and user_id == first_ta['id']['id']:
+            job.record("skipped", user_id)
+            return
+        await bulk_jobs.rate_limiter.acquire()
+        result = await tb_async.toggle_user_credentials(token, user_id, active)
+        if result.get("success"):
+            job.record("succeeded", user_id)
+        else:
+            job.record("failed", user_id, result.get("detail") or f"HTTP {result.get('status_code')}")
+
+    await bulk_jobs.submit(job, users(), toggle)
+    job.task.add_done_callback(lambda _: tenant_users_cache.invalidate(tenant_id))
+    return job
 
 @router.post("/tenant/{tenant_id}/deactivate-safe")
-def deactivate_safe(tenant_id: str, background_tasks: BackgroundTasks, token: str = Depends(get_tb_token), current_user: models.User = Depends(auth.require_role(["owner", "marketing", "developer"]))):
+async def deactivate_safe(tenant_id: str, token: str = Depends(get_tb_token), current_user: models.User = Depends(auth.require_role(["owner", "marketing", "developer"]))):
     ignore_domain = False
-    background_tasks.add_task(_bulk_user_action_task, tenant_id, token, False, ignore_domain)
-    return {"message": "Safe deactivation started in background"}
+    job = await _start_bulk_user_action(tenant_id, token, False, ignore_domain)
+    return {"message": "Safe deactivation started in background", "job_id": job.id}
 
 @router.post("/tenant/{tenant_id}/activate-safe")
-def activate_safe(tenant_id: str, background_tasks: BackgroundTasks, token: str = Depends(get_tb_token), current_user: models.User = Depends(auth.require_role(["owner", "marketing", "developer"]))):
-    background_tasks.add_task(_bulk_user_action_task, tenant_id, token, True)
-    return {"message": "Safe activation started in background"}
+async def activate_safe(tenant_id: str, token: str = Depends(get_tb_token), current_user: models.User = Depends(auth.require_role(["owner", "marketing", "developer"]))):
+    job = await _start_bulk_user_action(tenant_id, token, True)
+    return {"message": "Safe activation started in background", "job_id": job.id}
+
+@router.get("/jobs")
+def list_jobs(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.require_role(["owner", "marketing", "developer"]))):
+    return bulk_jobs.list_jobs(db)
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.require_role(["owner", "marketing", "developer"]))):
+    job = bulk_jobs.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.require_role(["owner", "marketing", "developer"]))):
+    # The worker running the job stops it at its next progress write
+    if not bulk_jobs.cancel(db, job_id):
+        job = bulk_jobs.get_job(db, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return {"message": "Cancellation requested", "job_id": job_id}
+
+async def _run_scheduled_deactivation(job: dict, token: str):
+    """scheduler handler: deactivate the tenant's users as a bulk job and wait for it."""
+    bulk = await _start_bulk_user_action(job["tenant_id"], token, False)
+    # Shielded: a shutdown cancels this handler (the job is requeued), the bulk job is closed by bulk_jobs.stop()
+    await asyncio.shield(bulk.task)
+    if bulk.status != "done":
+        raise RuntimeError(f"Bulk job {bulk.id} {bulk.status}: {bulk.detail or bulk.counts}")
+    return {"bulk_job_id": bulk.id, "counts": bulk.counts, "errors": bulk.errors}
+
+scheduler.register("deactivate_tenant_users", _run_scheduled_deactivation)
 
 @router.post("/tenant/{tenant_id}/schedule-deactivation")
 def schedule_deactivation(
     tenant_id: str, 
-    background_tasks: BackgroundTasks, 
     duration: int = Body(..., embed=True), 
     unit: str = Body("minutes", embed=True),
-    token: str = Depends(get_tb_token), 
+    db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.require_role(["owner", "marketing", "developer"]))
 ):
     delay_seconds = 0
@@ -364,26 +612,51 @@ def schedule_deactivation(
     else:
         delay_seconds = duration * 60 # Default to minutes
 
-    async def delayed_task():
-        await asyncio.sleep(delay_seconds)
-        _bulk_user_action_task(tenant_id, token, False)
-    
-    background_tasks.add_task(delayed_task)
-    return {"message": f"Deactivation scheduled in {duration} {unit}"}
-
-
+    # Persisted and run by the scheduler with the system token, so it survives restarts
+    run_at = scheduler.utcnow() + timedelta(seconds=delay_seconds)
+    job = scheduler.schedule(db, "deactivate_tenant_users", run_at, tenant_id=tenant_id, created_by_id=current_user.id)
+    return {"message": f"Deactivation scheduled in {duration} {unit}", "job_id": job.id, "run_at": job.run_at}
 
+@router.get("/scheduled-jobs")
+def list_scheduled_jobs(
+    status: Optional[str] = None,
+    tenant_id: Optional[str] = None,
+    limit: int = 100,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.require_role(["owner", "marketing", "developer"]))
+):
+    query = db.query(models.ScheduledJob)
+    if status:
+        query = query.filter(models.ScheduledJob.status == status)
+    if tenant_id:
+        query = query.filter(models.ScheduledJob.tenant_id == tenant_id)
+    rows = query.order_by(models.ScheduledJob.run_at.desc()).limit(min(max(limit, 1), 1000)).all()
+    return [scheduler.to_dict(r) for r in rows]
+
+@router.post("/scheduled-jobs/{job_id}/cancel")
+def cancel_scheduled_job(
+    job_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.require_role(["owner", "marketing", "developer"]))
+):
+    if not scheduler.cancel(db, job_id):
+        job = db.query(models.ScheduledJob).filter(models.ScheduledJob.id == job_id).first()
+        if not job:
+            raise HTTPException(status_code=404, detail="Scheduled job not found")
+        raise HTTPException(status_code=409, detail=f"Scheduled job already {job.status}")
+    return {"message": "Scheduled job cancelled", "job_id": job_id}
 
 @router.post("/user/{user_id}/toggle")
-def toggle_user(
+async def toggle_user(
     user_id: str, 
     enabled: bool = Body(..., embed=True), 
     tenant_id: Optional[str] = Body(None, embed=True),
     token: str = Depends(get_tb_token), 
+    db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.require_role(["owner", "marketing"]))
 ):
     # 1. Fetch User Details to check Authority
-    target_user = thingsboard.get_user_by_id(token, user_id)
+    target_user = await tb_async.get_user_by_id(token, user_id)
     active_token = token
     
     tenant_id_from_token = None
@@ -400,7 +673,7 @@ def toggle_user(
     if not target_tenant_id:
         try:
             # SysAdmin can login as user
-            user_token_str = thingsboard.get_user_token(token, user_id)
+            user_token_str = await tb_async.get_user_token(token, user_id)
             if user_token_str:
                 # Decode JWT to find tenantId
                 import base64
@@ -420,6 +693,7 @@ def toggle_user(
 
     # Determine validation logic
     should_impersonate = False
+    ta = None
     
     # Logic:
     # 1. If we know it's NOT a Tenant Admin (via target_user authority check), we MUST impersonate.
@@ -436,7 +710,7 @@ def toggle_user(
     if should_impersonate and target_tenant_id:
         
         # Optimization: Check if caller is ALREADY the correct Tenant Admin
-        caller = thingsboard.get_current_tb_user(token)
+        caller = await tb_async.get_current_tb_user(token)
         
         if caller and caller.get('authority') == 'TENANT_ADMIN':
             caller_tenant_id = caller.get('tenantId', {}).get('id')
@@ -445,16 +719,18 @@ def toggle_user(
                 should_impersonate = False
         
         if should_impersonate:
-            # Impersonate Tenant Admin
-            # Find a Tenant Admin
-            ta = thingsboard.get_first_tenant_admin(token, target_tenant_id)
-            if ta:
-                ta_token = thingsboard.get_user_token(token, ta['id']['id'])
-                if ta_token:
-                    active_token = ta_token
+            # Impersonate the tenant's primary Tenant Admin
+            ta, ta_token = await _impersonate_primary_admin(db, target_tenant_id, token)
+            if ta_token:
+                active_token = ta_token
+
+    result = await tb_async.toggle_user_credentials(active_token, user_id, enabled)
 
-    print(f"DEBUG: Final Token starts with: {active_token[:10]}...") 
-    result = thingsboard.toggle_user_credentials(active_token, user_id, enabled)
+    # A cached impersonation token was rejected (and evicted): retry once with a fresh one
+    if result.get("status_code") == 401 and active_token != token and ta:
+        ta_token = await tb_async.get_user_token(token, ta['id']['id'])
+        if ta_token:
+            result = await tb_async.toggle_user_credentials(ta_token, user_id, enabled)
 
     if not result.get("success"):
         status_code = result.get("status_code", 400)
@@ -468,6 +744,7 @@ def toggle_user(
         except:
             pass
         raise HTTPException(status_code=status_code, detail=detail)
+    tenant_users_cache.invalidate(target_tenant_id)
     return {"status": "success"}
 
 @router.post("/profile")
@@ -475,9 +752,11 @@ def create_profile(
     name: str = Body(..., embed=True),
     description: Optional[str] = Body(None, embed=True),
     token: str = Depends(get_tb_token),
+    db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.require_role(["owner", "co_owner", "developer"]))
 ):
     profile = thingsboard.create_tenant_profile(token, name, description)
     if not profile:
         raise HTTPException(status_code=400, detail="Failed to create tenant profile")
+    tb_profiles.remember_profile(db, profile)
     return profile
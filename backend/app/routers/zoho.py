@@ -1,17 +1,24 @@
 from fastapi import APIRouter, HTTPException, Depends, Body, BackgroundTasks
 from fastapi.responses import RedirectResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List
 import httpx
 import os
-import json
-import time
 from dotenv import load_dotenv
 from ..database import get_db
-from ..models import ZohoTenant, ZohoCustomer, Project, Usecase, PlanProfileMapping, ThingsboardProfile, User, ZohoProduct, ZohoPlan
+from ..models import ZohoTenant, ZohoCustomer, Project, Usecase, PlanProfileMapping, User, ZohoProduct, ZohoPlan
 from .. import schemas
+from .. import auth
 from .. import thingsboard
+from ..tb_tokens import get_system_token
 from .. import email_utils
+from .. import tenant_admins
+from .. import tb_profiles
+from .. import tenant_sync
+from .. import zoho_client
+from ..db_upsert import upsert_rows
+from ..zoho_tokens import zoho_tokens
 
 # Load environment variables
 env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), ".env")
@@ -23,104 +30,18 @@ router = APIRouter(
 )
 
 async def get_zoho_access_token():
-    # Define paths relative to backend directory
-    backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-    
-    # 1. Check for cached access token
-    access_token_path = os.path.join(backend_dir, "zoho_access_token.json")
-    if not os.path.exists(access_token_path):
-        # Fallback to CWD
-        cwd_path = os.path.join(os.getcwd(), "zoho_access_token.json")
-        if os.path.exists(cwd_path):
-            access_token_path = cwd_path
-
-    try:
-        if os.path.exists(access_token_path):
-            with open(access_token_path, "r") as f:
-                cached_data = json.load(f)
-                # Check if token is valid (with 5 minute buffer)
-                if cached_data.get("expires_at", 0) > time.time() + 300:
-                    return cached_data["access_token"]
-    except Exception as e:
-        print(f"Error reading cached access token: {e}")
+    access_token = await zoho_tokens.get_token()
+    if not access_token:
+        raise HTTPException(status_code=500, detail=f"Failed to generate access token: {zoho_tokens.last_error}")
+    return access_token
 
-    # 2. If no valid cached token, get new one using refresh token
-    client_id = os.getenv("ZOHO_CLIENT_ID")
-    client_secret = os.getenv("ZOHO_CLIENT_SECRET")
-    
-    # Read refresh token from zoho_token.txt
-    try:
-        token_path = os.path.join(backend_dir, "zoho_token.txt")
-        
-        if not os.path.exists(token_path):
-            # Fallback to CWD
-            token_path = os.path.join(os.getcwd(), "zoho_token.txt")
-            
-        print(f"DEBUG: Reading refresh token from {token_path}")
-        with open(token_path, "r") as f:
-            refresh_token = f.read().strip()
-    except Exception as e:
-        print(f"Error reading zoho_token.txt: {e}")
-        refresh_token = None
-
-    # Determine Zoho DC (Data Center) from env, default to .in
-    zoho_dc = os.getenv("ZOHO_DC", "in")
-    
-    # Helper to try fetching token from a specific DC
-    async def fetch_token_from_dc(dc):
-        url = f"https://accounts.zoho.{dc}/oauth/v2/token"
-        params = {
-            "refresh_token": refresh_token,
-            "client_id": client_id,
-            "client_secret": client_secret,
-            "grant_type": "refresh_token"
-        }
-        print(f"DEBUG: Fetching token from {dc} with params: client_id={client_id[:5]}..., refresh_token={refresh_token[:10]}...")
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, params=params)
-            resp_json = response.json()
-            print(f"DEBUG: Response from {dc}: {resp_json}")
-            return resp_json
-
-    try:
-        # Try configured DC first
-        data = await fetch_token_from_dc(zoho_dc)
-        
-        if "access_token" not in data:
-            # If .in fails, try .com as a last resort fallback
-            print(f"DEBUG: Failed with .in, trying .com fallback...")
-            data = await fetch_token_from_dc("com")
-            
-        if "access_token" not in data:
-            error_msg = data.get("error", "Unknown error")
-            raise HTTPException(status_code=500, detail=f"Failed to generate access token: {error_msg}. Response: {data}")
-            
-        # Update refresh token if a new one is provided (Refresh Token Rotation)
-        if "refresh_token" in data:
-            try:
-                with open(token_path, "w") as f:
-                    f.write(data["refresh_token"])
-            except Exception as e:
-                print(f"Warning: Failed to update zoho_token.txt: {e}")
-        
-        # Cache the new access token
-        try:
-            expires_in = data.get("expires_in", 3600) # Default to 1 hour
-            cache_data = {
-                "access_token": data["access_token"],
-                "expires_at": time.time() + expires_in
-            }
-            # Use the same path logic as reading
-            with open(access_token_path, "w") as f:
-                json.dump(cache_data, f)
-            print(f"DEBUG: Cached access token to {access_token_path}")
-        except Exception as e:
-            print(f"Warning: Failed to cache access token: {e}")
-            
-        return data["access_token"]
-
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=500, detail=f"Network error connecting to Zoho: {str(e)}")
+@router.get("/client/stats")
+def get_zoho_client_stats(current_user: User = Depends(auth.require_role(["owner", "co_owner"]))):
+    return {
+        "token": zoho_tokens.stats(),
+        "http2": zoho_client.HTTP2,
+        "page_concurrency": zoho_client.PAGE_CONCURRENCY,
+    }
 
 @router.get("/auth")
 async def zoho_auth():
@@ -160,51 +81,25 @@ async def zoho_callback(code: str = None, error: str = None):
         "grant_type": "authorization_code"
     }
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, params=params)
-            data = response.json()
-            
-            if "error" in data:
-                return {"error": data["error"]}
-                
-            refresh_token = data.get("refresh_token")
-            access_token = data.get("access_token")
-            
-            if refresh_token:
-                # Save refresh token to file
-                try:
-                    # Use robust path logic relative to backend dir
-                    backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-                    token_path = os.path.join(backend_dir, "zoho_token.txt")
-                    
-                    print(f"DEBUG: Saving new refresh token to {token_path}")
-                    with open(token_path, "w") as f:
-                        f.write(refresh_token)
-                except Exception as e:
-                    return {"error": f"Failed to save refresh token: {str(e)}"}
-            
-            if access_token:
-                # Cache access token
-                try:
-                    backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-                    access_token_path = os.path.join(backend_dir, "zoho_access_token.json")
-                        
-                    expires_in = data.get("expires_in", 3600)
-                    cache_data = {
-                        "access_token": access_token,
-                        "expires_at": time.time() + expires_in
-                    }
-                    with open(access_token_path, "w") as f:
-                        json.dump(cache_data, f)
-                    print(f"DEBUG: Cached access token to {access_token_path}")
-                except Exception as e:
-                    print(f"Warning: Failed to cache access token: {e}")
-
-            return {"message": "Zoho authentication successful! Tokens have been saved.", "refresh_token_saved": bool(refresh_token)}
-            
-        except httpx.RequestError as exc:
-            return {"error": f"Connection error: {str(exc)}"}
+    client = zoho_client.get_client()
+    try:
+        response = await client.post(url, params=params)
+        data = response.json()
+
+        if "error" in data:
+            return {"error": data["error"]}
+
+        # Storing the tokens writes the shared zoho_tokens row: keep it off the event loop
+        refresh_token = data.get("refresh_token")
+        if refresh_token and not await run_in_threadpool(zoho_tokens.set_refresh_token, refresh_token):
+            return {"error": "Failed to save refresh token"}
+        if "access_token" in data:
+            await run_in_threadpool(zoho_tokens.accept, data, zoho_dc)
+
+        return {"message": "Zoho authentication successful! Tokens have been saved.", "refresh_token_saved": bool(refresh_token)}
+
+    except httpx.RequestError as exc:
+        return {"error": f"Connection error: {str(exc)}"}
 
 @router.get("/plans")
 async def get_zoho_plans(db: Session = Depends(get_db)):
@@ -230,60 +125,41 @@ async def get_zoho_products(db: Session = Depends(get_db)):
 async def sync_zoho_plans_route(db: Session = Depends(get_db)):
     return await sync_zoho_plans(db)
 
+def _store_plans(db: Session, plans):
+    upsert_rows(db, ZohoPlan, "plan_code", [{
+        "plan_code": plan.get("plan_code"),
+        "product_id": plan.get("product_id"),
+        "product_type": plan.get("product_type"),
+        "plan_name": plan.get("name"),
+        "plan_description": plan.get("description"),
+        "unit_price": plan.get("recurring_price", 0), # Mapping recurring_price to unit_price as base
+        "recurring_price": plan.get("recurring_price", 0),
+        "setup_fee": plan.get("setup_fee", 0),
+        "interval": plan.get("interval"),
+        "interval_unit": plan.get("interval_unit"),
+        "billing_cycles": plan.get("billing_cycles"),
+        "trial_period": plan.get("trial_period"),
+        "status": plan.get("status"),
+        "created_time": plan.get("created_time"),
+        "updated_time": plan.get("updated_time"),
+    } for plan in plans])
+    db.commit()
+
 async def sync_zoho_plans(db: Session):
     try:
         print("Syncing Zoho Plans...")
         access_token = await get_zoho_access_token()
-        
-        zoho_dc = os.getenv("ZOHO_DC", "in")
-        api_domain = "zohoapis.in" if zoho_dc == "in" else "zohoapis.com"
-        org_id = os.getenv("ZOHO_BILLING_ORG_ID") or os.getenv("ZOHO_ORG_ID")
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-             # Fetch Org ID if missing (Simplification: Assuming org_id is present or fetched previously)
-             if not org_id:
-                # Fetch logic repeated or refactored. For now assuming env is set or fetched elsewhere.
-                pass
-
-             url = f"https://www.{api_domain}/billing/v1/plans"
-             headers = {
-                "Authorization": f"Zoho-oauthtoken {access_token}",
-                "Content-Type": "application/json"
-             }
-             if org_id:
-                headers["X-com-zoho-subscriptions-organizationid"] = org_id
-            
-             response = await client.get(url, headers=headers)
-             if response.status_code == 200:
-                 plans = response.json().get("plans", [])
-                 for plan in plans:
-                     db_plan = db.query(ZohoPlan).filter(ZohoPlan.plan_code == plan.get("plan_code")).first()
-                     if not db_plan:
-                         db_plan = ZohoPlan(plan_code=plan.get("plan_code"))
-                         db.add(db_plan)
-                     
-                     db_plan.product_id = plan.get("product_id")
-                     db_plan.product_type = plan.get("product_type")
-                     db_plan.plan_name = plan.get("name")
-                     db_plan.plan_description = plan.get("description")
-                     db_plan.unit_price = plan.get("recurring_price", 0) # Mapping recurring_price to unit_price as base
-                     db_plan.recurring_price = plan.get("recurring_price", 0)
-                     db_plan.setup_fee = plan.get("setup_fee", 0)
-                     db_plan.interval = plan.get("interval")
-                     db_plan.interval_unit = plan.get("interval_unit")
-                     db_plan.billing_cycles = plan.get("billing_cycles")
-                     db_plan.trial_period = plan.get("trial_period")
-                     db_plan.status = plan.get("status")
-                     db_plan.created_time = plan.get("created_time")
-                     db_plan.updated_time = plan.get("updated_time")
-                 
-                 db.commit()
-                 print(f"Synced {len(plans)} plans.")
-                 return plans
-             else:
-                 print(f"Failed to fetch plans: {response.text}")
-                 return []
+        headers = zoho_client.billing_headers(access_token, await zoho_client.get_org_id(access_token))
+
+        synced = []
+        # Each page is written as soon as it arrives
+        async for plans in zoho_client.iter_list_pages("plans", "plans", headers):
+            _store_plans(db, plans)
+            synced.extend(plans)
+        print(f"Synced {len(synced)} plans.")
+        return synced
     except Exception as e:
+        db.rollback()
         print(f"Error executing sync_zoho_plans: {e}")
         return []
 
@@ -291,47 +167,32 @@ async def sync_zoho_plans(db: Session):
 async def sync_zoho_products_route(db: Session = Depends(get_db)):
     return await sync_zoho_products(db)
 
+def _store_products(db: Session, products):
+    upsert_rows(db, ZohoProduct, "product_id", [{
+        "product_id": prod.get("product_id"),
+        "product_name": prod.get("name"),
+        "product_code": prod.get("product_code"), # Check if key exists
+        "description": prod.get("description"),
+        "status": prod.get("status"),
+        "created_time": prod.get("created_time"),
+        "updated_time": prod.get("updated_time"),
+    } for prod in products])
+    db.commit()
+
 async def sync_zoho_products(db: Session):
     try:
         print("Syncing Zoho Products...")
         access_token = await get_zoho_access_token()
-        
-        zoho_dc = os.getenv("ZOHO_DC", "in")
-        api_domain = "zohoapis.in" if zoho_dc == "in" else "zohoapis.com"
-        org_id = os.getenv("ZOHO_BILLING_ORG_ID") or os.getenv("ZOHO_ORG_ID")
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-             url = f"https://www.{api_domain}/billing/v1/products"
-             headers = {
-                "Authorization": f"Zoho-oauthtoken {access_token}",
-                "Content-Type": "application/json"
-             }
-             if org_id:
-                headers["X-com-zoho-subscriptions-organizationid"] = org_id
-            
-             response = await client.get(url, headers=headers)
-             if response.status_code == 200:
-                 products = response.json().get("products", [])
-                 for prod in products:
-                     db_prod = db.query(ZohoProduct).filter(ZohoProduct.product_id == prod.get("product_id")).first()
-                     if not db_prod:
-                         db_prod = ZohoProduct(product_id=prod.get("product_id"))
-                         db.add(db_prod)
-                     
-                     db_prod.product_name = prod.get("name")
-                     db_prod.product_code = prod.get("product_code") # Check if key exists
-                     db_prod.description = prod.get("description")
-                     db_prod.status = prod.get("status")
-                     db_prod.created_time = prod.get("created_time")
-                     db_prod.updated_time = prod.get("updated_time")
-                 
-                 db.commit()
-                 print(f"Synced {len(products)} products.")
-                 return products
-             else:
-                 print(f"Failed to fetch products: {response.text}")
-                 return []
+        headers = zoho_client.billing_headers(access_token, await zoho_client.get_org_id(access_token))
+
+        synced = []
+        async for products in zoho_client.iter_list_pages("products", "products", headers):
+            _store_products(db, products)
+            synced.extend(products)
+        print(f"Synced {len(synced)} products.")
+        return synced
     except Exception as e:
+        db.rollback()
         print(f"Error executing sync_zoho_products: {e}")
         return []
 
@@ -342,170 +203,109 @@ async def sync_zoho_data(db: Session):
     await sync_zoho_plans(db)
     print("Background Zoho Sync Completed.")
 
+def _store_subscriptions(db: Session, subscriptions, project_names, project_emails):
+    rows = []
+    for sub in subscriptions:
+        # Determine Provision Status
+        # Check if Project exists by Name OR Email
+        is_provisioned = (sub.get("customer_name") in project_names) or \
+                         (sub.get("email") in project_emails)
+
+        sub["is_provisioned"] = is_provisioned
+
+        rows.append({
+            "subscription_id": sub.get("subscription_id"),
+            "is_provisioned": is_provisioned,
+            "customer_id": sub.get("customer_id"),
+            "customer_name": sub.get("customer_name"),
+            "email": sub.get("email"),
+            "plan_name": sub.get("plan_name"),
+            "plan_code": sub.get("plan_code"),
+            "status": sub.get("status"),
+            "amount": sub.get("amount"),
+            "currency_symbol": sub.get("currency_symbol"),
+            "current_term_starts_at": sub.get("current_term_starts_at"),
+            "current_term_ends_at": sub.get("current_term_ends_at"),
+            "interval": sub.get("interval"),
+            "interval_unit": sub.get("interval_unit"),
+            "created_at": sub.get("created_at"),
+        })
+    upsert_rows(db, ZohoTenant, "subscription_id", rows)
+    db.commit()
+
 @router.get("/subscriptions")
 async def get_zoho_subscriptions(db: Session = Depends(get_db)):
     # 1. Get Access Token
     access_token = await get_zoho_access_token()
-    
-    # Determine API domain based on DC
-    zoho_dc = os.getenv("ZOHO_DC", "in")
-    api_domain = "zohoapis.in" if zoho_dc == "in" else "zohoapis.com" # Add more if needed (eu, au, etc)
-    
-    # 2. Fetch Subscriptions from Zoho
-    # Try ZOHO_BILLING_ORG_ID first, then ZOHO_ORG_ID
-    org_id = os.getenv("ZOHO_BILLING_ORG_ID") or os.getenv("ZOHO_ORG_ID")
-    
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        # If Org ID is missing, try to fetch it
-        if not org_id:
-            print("Org ID not found in env, fetching from Zoho...")
-            org_url = f"https://www.{api_domain}/billing/v1/organizations"
-            headers = {
-                "Authorization": f"Zoho-oauthtoken {access_token}",
-                "Content-Type": "application/json"
-            }
-            try:
-                org_resp = await client.get(org_url, headers=headers)
-                org_data = org_resp.json()
-                if org_resp.status_code == 200 and "organizations" in org_data and len(org_data["organizations"]) > 0:
-                    org_id = org_data["organizations"][0]["organization_id"]
-                    print(f"Fetched Org ID: {org_id}")
-                else:
-                    print(f"Failed to fetch organizations: {org_data}")
-            except Exception as e:
-                print(f"Error fetching organizations: {e}")
-
-        url = f"https://www.{api_domain}/billing/v1/subscriptions?per_page=200"
-        
-        headers = {
-            "Authorization": f"Zoho-oauthtoken {access_token}",
-            "Content-Type": "application/json"
-        }
-        if org_id:
-            headers["X-com-zoho-subscriptions-organizationid"] = org_id
-        
-        try:
-            print(f"Fetching subscriptions from: {url}")
-            response = await client.get(url, headers=headers)
-            data = response.json()
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=data.get("message", f"Failed to fetch subscriptions from Zoho. Status: {response.status_code}, Response: {data}")
-                )
-            
-            subscriptions = data.get("subscriptions", [])
-            print(f"Fetched {len(subscriptions)} subscriptions from Zoho.")
-            
-            # Get list of existing project names AND emails
-            existing_projects = db.query(Project.name, Project.customer_email).all()
-            existing_project_names = {p.name for p in existing_projects}
-            existing_project_emails = {p.customer_email for p in existing_projects if p.customer_email}
-
-            # 3. Save to Database
-            for sub in subscriptions:
-                # Check if exists in DB
-                db_sub = db.query(ZohoTenant).filter(ZohoTenant.subscription_id == sub.get("subscription_id")).first()
-                
-                # Determine Provision Status
-                # Check if Project exists by Name OR Email
-                is_provisioned = (sub.get("customer_name") in existing_project_names) or \
-                                 (sub.get("email") in existing_project_emails)
-
-                sub["is_provisioned"] = is_provisioned
-
-                if not db_sub:
-                    db_sub = ZohoTenant(subscription_id=sub.get("subscription_id"))
-                    db.add(db_sub)
-                
-                # Update fields
-                db_sub.is_provisioned = is_provisioned
-                db_sub.customer_id = sub.get("customer_id")
-                db_sub.customer_name = sub.get("customer_name")
-                db_sub.email = sub.get("email")
-                db_sub.plan_name = sub.get("plan_name")
-                db_sub.plan_code = sub.get("plan_code")
-                db_sub.status = sub.get("status")
-                db_sub.amount = sub.get("amount")
-                db_sub.currency_symbol = sub.get("currency_symbol")
-                db_sub.current_term_starts_at = sub.get("current_term_starts_at")
-                db_sub.current_term_ends_at = sub.get("current_term_ends_at")
-                db_sub.interval = sub.get("interval")
-                db_sub.interval_unit = sub.get("interval_unit")
-                db_sub.created_at = sub.get("created_at")
-                
-            db.commit()
-            
-            return data
-            
-        except httpx.RequestError as exc:
-            print(f"Request Error: {exc}")
-            raise HTTPException(status_code=500, detail=f"Connection error while requesting {exc.request.url!r}: {str(exc)}")
-        except Exception as e:
-            print(f"Unexpected Error: {e}")
-            raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+    try:
+        headers = zoho_client.billing_headers(access_token, await zoho_client.get_org_id(access_token))
+
+        # Get list of existing project names AND emails
+        existing_projects = db.query(Project.name, Project.customer_email).all()
+        existing_project_names = {p.name for p in existing_projects}
+        existing_project_emails = {p.customer_email for p in existing_projects if p.customer_email}
+
+        # 2. Fetch every page of subscriptions, saving each page as it arrives
+        subscriptions = []
+        async for page in zoho_client.iter_list_pages("subscriptions", "subscriptions", headers):
+            _store_subscriptions(db, page, existing_project_names, existing_project_emails)
+            subscriptions.extend(page)
+        print(f"Fetched {len(subscriptions)} subscriptions from Zoho.")
+
+        return {"message": f"Successfully synced {len(subscriptions)} subscriptions", "subscriptions": subscriptions}
+
+    except zoho_client.ZohoAPIError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except httpx.RequestError as exc:
+        db.rollback()
+        print(f"Request Error: {exc}")
+        raise HTTPException(status_code=500, detail=f"Connection error while requesting {exc.request.url!r}: {str(exc)}")
+    except Exception as e:
+        db.rollback()
+        print(f"Unexpected Error: {e}")
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+def _store_customers(db: Session, customers):
+    upsert_rows(db, ZohoCustomer, "customer_id", [{
+        "customer_id": cust.get("customer_id"),
+        "display_name": cust.get("display_name"),
+        "first_name": cust.get("first_name"),
+        "last_name": cust.get("last_name"),
+        "email": cust.get("email"),
+        "company_name": cust.get("company_name"),
+        "phone": cust.get("phone"),
+        "mobile": cust.get("mobile"),
+        "currency_code": cust.get("currency_code"),
+        "status": cust.get("status"),
+        "created_time": cust.get("created_time"),
+        "updated_time": cust.get("updated_time"),
+    } for cust in customers])
+    db.commit()
 
 @router.get("/customers")
 async def get_zoho_customers(db: Session = Depends(get_db)):
     # 1. Get Access Token
     access_token = await get_zoho_access_token()
-    
-    # 2. Fetch Customers from Zoho
-    org_id = os.getenv("ZOHO_BILLING_ORG_ID")
-    # Use .in or .com based on DC, but usually the API endpoint is zohoapis.com or zohoapis.in
-    zoho_dc = os.getenv("ZOHO_DC", "com")
-    base_url = "https://www.zohoapis.in" if zoho_dc == "in" else "https://www.zohoapis.com"
-    url = f"{base_url}/billing/v1/customers?per_page=200"
-    
-    headers = {
-        "Authorization": f"Zoho-oauthtoken {access_token}",
-        "Content-Type": "application/json"
-    }
-    if org_id:
-        headers["X-com-zoho-subscriptions-organizationid"] = org_id
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers)
-            data = response.json()
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=data.get("message", "Failed to fetch customers from Zoho")
-                )
-            
-            customers = data.get("customers", [])
-            
-            # 3. Save to Database
-            for cust in customers:
-                # Check if exists
-                db_cust = db.query(ZohoCustomer).filter(ZohoCustomer.customer_id == cust.get("customer_id")).first()
-                
-                if not db_cust:
-                    db_cust = ZohoCustomer(customer_id=cust.get("customer_id"))
-                    db.add(db_cust)
-                
-                # Update fields
-                db_cust.display_name = cust.get("display_name")
-                db_cust.first_name = cust.get("first_name")
-                db_cust.last_name = cust.get("last_name")
-                db_cust.email = cust.get("email")
-                db_cust.company_name = cust.get("company_name")
-                db_cust.phone = cust.get("phone")
-                db_cust.mobile = cust.get("mobile")
-                db_cust.currency_code = cust.get("currency_code")
-                db_cust.status = cust.get("status")
-                db_cust.created_time = cust.get("created_time")
-                db_cust.updated_time = cust.get("updated_time")
-                
-            db.commit()
-            
-            return {"message": f"Successfully synced {len(customers)} customers", "customers": customers}
-            
-        except httpx.RequestError as exc:
-            raise HTTPException(status_code=500, detail=f"An error occurred while requesting {exc.request.url!r}.")
+
+    try:
+        headers = zoho_client.billing_headers(access_token, await zoho_client.get_org_id(access_token))
+
+        # 2. Fetch every page of customers, saving each page as it arrives
+        customers = []
+        async for page in zoho_client.iter_list_pages("customers", "customers", headers):
+            _store_customers(db, page)
+            customers.extend(page)
+
+        return {"message": f"Successfully synced {len(customers)} customers", "customers": customers}
+
+    except zoho_client.ZohoAPIError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except httpx.RequestError as exc:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"An error occurred while requesting {exc.request.url!r}.")
 
 @router.get("/stored_tenants", response_model=List[schemas.ZohoTenant])
 def get_stored_zoho_tenants(include_provisioned: bool = False, db: Session = Depends(get_db)):
@@ -549,7 +349,8 @@ def provision_zoho_tenant(
                 selected_usecase = uc.name
                 break
     
-    # 3. Determine Thingsboard Profile
+    # 3. Determine Thingsboard Profile (mirror is synced first if it was never populated)
+    tb_profiles.list_profiles(db, get_system_token())
     mappings = db.query(PlanProfileMapping).all()
     selected_profile_id = None
     
@@ -557,28 +358,22 @@ def provision_zoho_tenant(
         if (zoho_tenant.plan_name and m.zoho_plan_keyword in zoho_tenant.plan_name) or \
            (zoho_tenant.plan_code and m.zoho_plan_keyword in zoho_tenant.plan_code):
             
-            profile = db.query(ThingsboardProfile).filter(ThingsboardProfile.name == m.tb_profile_name).first()
+            profile = tb_profiles.get_by_name(db, m.tb_profile_name)
             if profile:
-                selected_profile_id = profile.tb_profile_id
+                selected_profile_id = profile['id']['id']
                 break
     
     if not selected_profile_id:
-        default_profile = db.query(ThingsboardProfile).filter(ThingsboardProfile.is_default == True).first()
+        default_profile = tb_profiles.get_default(db)
         if default_profile:
-            selected_profile_id = default_profile.tb_profile_id
+            selected_profile_id = default_profile['id']['id']
         else:
             raise HTTPException(status_code=500, detail="No matching profile found and no default profile configured.")
 
     # 4. Create Thingsboard Tenant
-    try:
-        tb_username = os.getenv("TB_USERNAME")
-        tb_password = os.getenv("TB_PASSWORD")
-        token_response = thingsboard.tb_login(tb_username, tb_password)
-        tb_token = token_response.get("token")
-        if not tb_token:
-             raise HTTPException(status_code=500, detail="Failed to authenticate with ThingsBoard.")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"ThingsBoard login failed: {str(e)}")
+    tb_token = get_system_token()
+    if not tb_token:
+        raise HTTPException(status_code=500, detail="Failed to authenticate with ThingsBoard.")
 
     tenant_title = zoho_tenant.customer_name
     
@@ -588,6 +383,8 @@ def provision_zoho_tenant(
         raise HTTPException(status_code=400, detail="Failed to create tenant in ThingsBoard (or it already exists).")
 
     tenant_id = new_tenant['id']['id']
+    # /tb/tenants reads the local tenants table; don't wait for the next sync
+    tenant_sync.remember_tenant(db, new_tenant)
 
     # 5. Create Tenant Admin
     first_name = "Technical Admin"
@@ -612,6 +409,10 @@ def provision_zoho_tenant(
 
     activation_link = None
     if admin_user:
+        # The email fallback may find a customer user; the primary admin is then
+        # resolved later from the tenant's oldest Tenant Admin
+        if admin_user.get('authority') == 'TENANT_ADMIN':
+            tenant_admins.remember_primary_admin(db, tenant_id, admin_user)
         admin_user_id = admin_user['id']['id']
         activation_link = thingsboard.get_activation_link(tb_token, admin_user_id)
     
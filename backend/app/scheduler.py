@@ -0,0 +1,224 @@
+"""
+Persistent scheduled jobs (e.g. a tenant's delayed deactivation).
+
+Jobs are rows in scheduled_jobs, so they survive restarts and cost nothing
+while they wait. Every worker process runs one dispatcher loop that polls
+for due pending jobs every TB_SCHEDULER_POLL_INTERVAL seconds (sooner when
+the next job is due earlier) and claims each one with a conditional UPDATE
+(status pending -> running); only the worker whose UPDATE matched runs it,
+so a job runs exactly once across replicas. Handlers are registered per kind with register(); they run with
+the ThingsBoard system token obtained at run time. Jobs cut off by a
+shutdown, or claimed by a worker that died (still "running" after
+TB_SCHEDULER_STALE_AFTER seconds), go back to pending and run again.
+"""
+import asyncio
+import json
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from . import models
+from .database import SessionLocal
+from .tb_tokens import get_system_token
+
+POLL_INTERVAL = int(os.getenv("TB_SCHEDULER_POLL_INTERVAL", "15"))
+# Jobs still "running" this long after their claim belonged to a worker that died; they are re-run
+STALE_AFTER = int(os.getenv("TB_SCHEDULER_STALE_AFTER", "21600"))
+CLAIM_BATCH = 50
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_handlers = {}  # kind -> async callable(job: dict, token: str) -> dict summary
+_task = None
+_wakeup = None
+_loop = None
+_running = {}  # task -> job dict, for the jobs this worker is executing
+_stopping = False
+
+
+def register(kind, handler):
+    _handlers[kind] = handler
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+def to_dict(row):
+    return {
+        "id": row.id,
+        "kind": row.kind,
+        "tenant_id": row.tenant_id,
+        "run_at": row.run_at,
+        "status": row.status,
+        "created_by_id": row.created_by_id,
+        "created_at": row.created_at,
+        "claimed_by": row.claimed_by,
+        "claimed_at": row.claimed_at,
+        "finished_at": row.finished_at,
+        "result": json.loads(row.result) if row.result else None,
+    }
+
+def schedule(db: Session, kind: str, run_at: datetime, tenant_id: str = None, created_by_id: int = None):
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for scheduled job kind '{kind}'")
+    row = models.ScheduledJob(kind=kind, tenant_id=tenant_id, run_at=run_at, status="pending", created_by_id=created_by_id)
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+    wake()
+    return row
+
+def cancel(db: Session, job_id: int):
+    """Cancel a pending job; False if it does not exist or already started."""
+    claimed = db.execute(
+        update(models.ScheduledJob)
+        .where(models.ScheduledJob.id == job_id, models.ScheduledJob.status == "pending")
+        .values(status="cancelled", finished_at=utcnow())
+    ).rowcount
+    db.commit()
+    return claimed == 1
+
+def _claim_due(db: Session):
+    """Claim due pending jobs for this worker -> (job dicts it now owns, run_at of the next pending job)."""
+    now = utcnow()
+    # Running jobs whose worker died go back to pending (and are claimed below)
+    requeued = db.execute(
+        update(models.ScheduledJob)
+        .where(models.ScheduledJob.status == "running", models.ScheduledJob.claimed_at < now - timedelta(seconds=STALE_AFTER))
+        .values(status="pending", claimed_by=None, claimed_at=None)
+    ).rowcount
+    db.commit()
+    if requeued:
+        print(f"Requeued {requeued} scheduled jobs of workers that stopped")
+
+    due_ids = [r[0] for r in db.query(models.ScheduledJob.id).filter(
+        models.ScheduledJob.status == "pending", models.ScheduledJob.run_at <= now
+    ).order_by(models.ScheduledJob.run_at).limit(CLAIM_BATCH)]
+
+    claimed = []
+    for job_id in due_ids:
+        # Exactly one worker's UPDATE matches status == pending
+        rowcount = db.execute(
+            update(models.ScheduledJob)
+            .where(models.ScheduledJob.id == job_id, models.ScheduledJob.status == "pending")
+            .values(status="running", claimed_by=WORKER_ID, claimed_at=now)
+        ).rowcount
+        db.commit()
+        if rowcount == 1:
+            claimed.append(to_dict(db.get(models.ScheduledJob, job_id)))
+
+    next_run_at = db.query(models.ScheduledJob.run_at).filter(
+        models.ScheduledJob.status == "pending"
+    ).order_by(models.ScheduledJob.run_at).limit(1).scalar()
+    return claimed, next_run_at
+
+def _finish(job_id, status, result):
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(models.ScheduledJob)
+            .where(models.ScheduledJob.id == job_id)
+            .values(status=status, finished_at=utcnow(), result=json.dumps(result, default=str))
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def _requeue(jobs):
+    """Put jobs this worker claimed but did not finish back to pending."""
+    db = SessionLocal()
+    try:
+        for job in jobs:
+            # Only while the row still carries this worker's claim
+            db.execute(
+                update(models.ScheduledJob)
+                .where(models.ScheduledJob.id == job["id"], models.ScheduledJob.status == "running",
+                       models.ScheduledJob.claimed_by == WORKER_ID, models.ScheduledJob.claimed_at == job["claimed_at"])
+                .values(status="pending", claimed_by=None, claimed_at=None)
+            )
+        db.commit()
+    finally:
+        db.close()
+
+def _poll():
+    db = SessionLocal()
+    try:
+        return _claim_due(db)
+    finally:
+        db.close()
+
+async def _execute(job):
+    handler = _handlers.get(job["kind"])
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for '{job['kind']}'")
+        token = await run_in_threadpool(get_system_token)
+        if not token:
+            raise RuntimeError("Failed to authenticate with ThingsBoard")
+        result = await handler(job, token)
+        status = "done"
+    except Exception as e:
+        result, status = {"error": str(e)}, "failed"
+    if status == "failed" and _stopping:
+        return  # cut off by the shutdown; stop() puts it back to pending
+    print(f"Scheduled job {job['id']} ({job['kind']}, tenant {job['tenant_id']}) {status}")
+    await run_in_threadpool(_finish, job["id"], status, result)
+
+def _seconds_until(run_at):
+    if run_at.tzinfo is None:  # SQLite hands back naive UTC
+        run_at = run_at.replace(tzinfo=timezone.utc)
+    return (run_at - utcnow()).total_seconds()
+
+async def _run_dispatcher():
+    while True:
+        delay = POLL_INTERVAL
+        _wakeup.clear()
+        try:
+            claimed, next_run_at = await run_in_threadpool(_poll)
+            for job in claimed:
+                task = asyncio.create_task(_execute(job))
+                _running[task] = job
+                task.add_done_callback(lambda t: _running.pop(t, None))
+            if next_run_at is not None:
+                delay = min(delay, max(_seconds_until(next_run_at), 0.1))
+        except Exception as e:
+            print(f"Scheduler poll failed: {e}")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+def wake():
+    """Poll right away, e.g. after scheduling a job that is due before the next poll."""
+    if _loop is not None and _wakeup is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+def start():
+    """Start the dispatcher on the running event loop."""
+    global _task, _wakeup, _loop, _stopping
+    _stopping = False
+    if POLL_INTERVAL > 0 and _task is None:
+        _loop = asyncio.get_running_loop()
+        _wakeup = asyncio.Event()
+        _task = _loop.create_task(_run_dispatcher())
+
+async def stop():
+    """Stop polling, cancel the jobs this worker is running and put them back to pending."""
+    global _task, _loop, _stopping
+    _stopping = True
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+        _loop = None
+    running = dict(_running)
+    for task in running:
+        task.cancel()
+    await asyncio.gather(*running, return_exceptions=True)
+    if running:
+        await run_in_threadpool(_requeue, list(running.values()))
+        print(f"Requeued {len(running)} scheduled jobs cut off by the shutdown")
@@ -0,0 +1,110 @@
+"""
+Circuit breaker for ThingsBoard calls.
+
+When TB stops answering (connection errors, timeouts, 5xx) every request
+would otherwise wait for its full timeout and retries. After
+TB_BREAKER_FAILURES consecutive failures against a base URL the breaker
+opens and calls fail immediately with CircuitOpenError; after
+TB_BREAKER_RESET seconds one probe call is let through (half-open) and its
+outcome closes or re-opens the breaker. Shared by the sync and async
+clients.
+"""
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+FAILURE_THRESHOLD = int(os.getenv("TB_BREAKER_FAILURES", "5"))
+RESET_TIMEOUT = float(os.getenv("TB_BREAKER_RESET", "30"))
+
+# Answers that mean TB (or the proxy in front of it) is unhealthy
+FAILURE_STATUSES = frozenset([500, 502, 503, 504])
+
+# Retries performed by the clients, for monitoring
+retry_counts = {"sync": 0, "async": 0}
+
+
+class CircuitOpenError(ConnectionError):
+    """TB is considered down; the call was not attempted."""
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"  # closed, open, half_open
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._probe_started = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless the call may go ahead."""
+        with self._lock:
+            if self.state == "open" and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "closed":
+                return
+            # A probe that never reported back (e.g. cancelled) doesn't block the next one forever
+            if self.state == "half_open" and (not self._probe_in_flight or time.time() - self._probe_started >= self.reset_timeout):
+                self._probe_in_flight = True
+                self._probe_started = time.time()
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"ThingsBoard at {self.name} is unavailable (circuit open), try again later")
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                    print(f"Circuit for ThingsBoard at {self.name} opened after {self.consecutive_failures} failures")
+                self.state = "open"
+                self.opened_at = time.time()
+
+    def record_status(self, status_code):
+        if status_code in FAILURE_STATUSES:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "open_for": int(time.time() - self.opened_at) if self.state == "open" else 0,
+        }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(url):
+    """Breaker of the scheme://host:port that `url` points to."""
+    parts = urlsplit(str(url))
+    name = f"{parts.scheme}://{parts.netloc}"
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+def stats():
+    return {
+        "breakers": {name: b.stats() for name, b in _breakers.items()},
+        "retries": dict(retry_counts),
+    }
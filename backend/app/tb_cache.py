@@ -0,0 +1,178 @@
+"""
+Small in-process caches for ThingsBoard data.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire individually.
+
+    Thread-safe, so the sync client (threadpool) and the async client
+    (event loop) can share one instance. Hit/miss counters are kept for
+    monitoring.
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value for `ttl` seconds (the cache default if None); ttl <= 0 stores nothing."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def discard_value(self, value):
+        """Remove every entry holding `value`; returns how many were removed."""
+        with self._lock:
+            keys = [k for k, (_, v) in self._data.items() if v == value]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SWRCache:
+    """Stale-while-revalidate cache for expensive async loads.
+
+    Entries younger than `fresh_ttl` are served as is. Older ones, up to
+    `max_stale`, are still served immediately while a single background
+    load replaces them; beyond that callers wait for a new load. Concurrent
+    loads of one key are shared. Entries belong to a group (e.g. a tenant)
+    that can be invalidated at once; a load that started before the
+    invalidation is returned to its waiters but not stored.
+
+    Only use from one event loop; it is not thread-safe.
+    """
+
+    def __init__(self, maxsize=128, fresh_ttl=30, max_stale=600):
+        self.maxsize = maxsize
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self._data = OrderedDict()  # key -> (loaded_at, group, value)
+        self._inflight = {}  # key -> (asyncio.Task, group)
+        self._generations = {}  # group -> invalidation counter
+        self._epoch = 0  # bumped by invalidate() without a group
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    async def get(self, key, loader, group=None):
+        """Value for key; `loader` is an async callable producing it."""
+        entry = self._data.get(key)
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age < self.fresh_ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if age < self.max_stale:
+                self._data.move_to_end(key)
+                self.stale_hits += 1
+                self._start_load(key, loader, group)
+                return entry[2]
+        self.misses += 1
+        # shield: a cancelled request must not cancel a load others may share
+        return await asyncio.shield(self._start_load(key, loader, group))
+
+    def _start_load(self, key, loader, group):
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return inflight[0]
+        task = asyncio.get_running_loop().create_task(self._load(key, loader, group))
+        task.add_done_callback(self._log_failure)
+        self._inflight[key] = (task, group)
+        return task
+
+    def _version(self, group):
+        return (self._epoch, self._generations.get(group, 0))
+
+    async def _load(self, key, loader, group):
+        version = self._version(group)
+        try:
+            value = await loader()
+            if self._version(group) == version:
+                self._data[key] = (time.time(), group, value)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+            return value
+        finally:
+            inflight = self._inflight.get(key)
+            if inflight is not None and inflight[0] is asyncio.current_task():
+                del self._inflight[key]
+
+    def _log_failure(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self.refresh_errors += 1
+            print(f"Cache load failed: {task.exception()}")
+
+    def invalidate(self, group=None):
+        """Drop every entry of `group`, or everything if group is None."""
+        if group is None:
+            self._epoch += 1
+        else:
+            self._generations[group] = self._generations.get(group, 0) + 1
+        for key in [k for k, (_, g, _) in self._data.items() if group is None or g == group]:
+            del self._data[key]
+        # Later callers start a new load instead of joining one that may be outdated
+        for key in [k for k, (_, g) in self._inflight.items() if group is None or g == group]:
+            del self._inflight[key]
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refresh_errors": self.refresh_errors,
+            "loading": len(self._inflight),
+        }
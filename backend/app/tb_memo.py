@@ -0,0 +1,72 @@
+"""
+Request-scoped memo of ThingsBoard GET responses.
+
+One inbound API request often reads the same TB resource several times
+(the tenant's users, the current user, ...). While a request is being
+handled (see the middleware in main.py) successful GETs are remembered by
+method, URL incl. query string and X-Authorization header, and identical
+GETs are answered from memory. Any non-GET call through the TB clients
+clears the memo, since it may have changed what a GET returns. Both the
+sync session and the async client consult it at the transport level.
+"""
+import threading
+from contextvars import ContextVar
+
+_current = ContextVar("tb_request_memo", default=None)
+
+# Process-wide totals, for /tb/client/stats
+totals = {"requests": 0, "tb_gets": 0, "saved": 0}
+
+
+class RequestMemo:
+    def __init__(self):
+        self._responses = {}  # key -> (status_code, headers, content, reason)
+        self._lock = threading.Lock()
+        self.inflight = {}  # key -> asyncio.Future, for identical concurrent GETs (async client)
+        self.active = True
+        self.gets = 0
+        self.saved = 0
+
+    def lookup(self, key):
+        with self._lock:
+            self.gets += 1
+            hit = self._responses.get(key)
+            if hit is not None:
+                self.saved += 1
+            return hit
+
+    def store(self, key, status_code, headers, content, reason=None):
+        if status_code == 200:
+            with self._lock:
+                self._responses[key] = (status_code, headers, content, reason)
+
+    def count_shared(self):
+        """An identical in-flight GET was awaited instead of sending another one."""
+        with self._lock:
+            self.saved += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._responses.clear()
+        self.inflight.clear()
+
+
+def request_key(method, url, headers):
+    return (method, str(url), headers.get("X-Authorization"))
+
+def current():
+    """Memo of the request being handled, or None outside one (startup, background jobs)."""
+    memo = _current.get()
+    return memo if memo is not None and memo.active else None
+
+def begin():
+    memo = RequestMemo()
+    return memo, _current.set(memo)
+
+def end(memo, reset_token):
+    # Background tasks / loads spawned by the request keep the context but stop using the memo
+    memo.active = False
+    _current.reset(reset_token)
+    totals["requests"] += 1
+    totals["tb_gets"] += memo.gets
+    totals["saved"] += memo.saved
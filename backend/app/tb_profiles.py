@@ -0,0 +1,136 @@
+"""
+Local mirror of ThingsBoard tenant profiles.
+
+Tenant profiles change rarely, yet the UI, create_tenant and Zoho
+provisioning all need them. They are kept in the thingsboard_profiles
+table and synced from TB on demand: a profile is only written when it is
+new, was re-created under the same id (different createdTime) or had its
+name / description / default flag edited. Lookups go through an
+in-memory index by id and by name that is rebuilt after every sync and
+reloaded from the table periodically so other workers pick up changes.
+"""
+import os
+import threading
+import time
+from sqlalchemy.orm import Session
+from . import models, thingsboard
+
+# Seconds before a worker re-reads its index from the table
+INDEX_TTL = int(os.getenv("TB_PROFILE_INDEX_TTL", "60"))
+
+_lock = threading.Lock()
+_index = {"by_id": {}, "by_name": {}, "default": None}
+_loaded_at = 0
+last_sync = None
+
+
+def to_tb_profile(row):
+    """thingsboard_profiles row -> dict in the shape TB returns for /api/tenantProfiles."""
+    return {
+        "id": {"id": row.tb_profile_id, "entityType": "TENANT_PROFILE"},
+        "name": row.name,
+        "description": row.description,
+        "default": bool(row.is_default),
+        "createdTime": row.tb_created_time,
+    }
+
+def _build_index(rows):
+    by_id, by_name, default = {}, {}, None
+    for row in rows:
+        profile = to_tb_profile(row)
+        by_id[row.tb_profile_id] = profile
+        by_name[row.name] = profile
+        if row.is_default and default is None:
+            default = profile
+    return {"by_id": by_id, "by_name": by_name, "default": default}
+
+def reload_index(db: Session):
+    global _index, _loaded_at
+    rows = db.query(models.ThingsboardProfile).order_by(models.ThingsboardProfile.tb_created_time).all()
+    with _lock:
+        _index = _build_index(rows)
+        _loaded_at = time.time()
+    return _index
+
+def _get_index(db: Session):
+    if time.time() - _loaded_at > INDEX_TTL:
+        return reload_index(db)
+    return _index
+
+def sync_profiles(db: Session, token: str):
+    """Bring thingsboard_profiles in line with TB; returns counts of what changed.
+
+    Raises ThingsBoardError if the profile list could not be read completely,
+    so a partial listing never deletes local rows.
+    """
+    global last_sync
+    remote = thingsboard.get_tenant_profiles(token)
+    local = {row.tb_profile_id: row for row in db.query(models.ThingsboardProfile).all()}
+    counts = {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+
+    for p in remote:
+        profile_id = p['id']['id']
+        values = {
+            "name": p.get('name'),
+            "description": p.get('description'),
+            "is_default": bool(p.get('default')),
+            "tb_created_time": p.get('createdTime'),
+        }
+        row = local.pop(profile_id, None)
+        if row is None:
+            db.add(models.ThingsboardProfile(tb_profile_id=profile_id, **values))
+            counts["created"] += 1
+            continue
+        # createdTime (part of values) catches re-created profiles; TB keeps it on edits,
+        # so the edited fields are compared as well
+        if all(getattr(row, k) == v for k, v in values.items()):
+            counts["unchanged"] += 1
+            continue
+        for k, v in values.items():
+            setattr(row, k, v)
+        counts["updated"] += 1
+
+    # Whatever is left locally no longer exists in TB
+    for row in local.values():
+        db.delete(row)
+        counts["deleted"] += 1
+
+    db.commit()
+    reload_index(db)
+    last_sync = time.time()
+    if counts["created"] or counts["updated"] or counts["deleted"]:
+        print(f"Synced ThingsBoard tenant profiles: {counts}")
+    return counts
+
+def list_profiles(db: Session, token: str = None, refresh: bool = False):
+    """All mirrored profiles in TB shape; syncs first if forced or nothing is mirrored yet."""
+    index = _get_index(db)
+    if token and (refresh or not index["by_id"]):
+        sync_profiles(db, token)
+        index = _index
+    return list(index["by_id"].values())
+
+def get_by_id(db: Session, profile_id: str):
+    return _get_index(db)["by_id"].get(profile_id)
+
+def get_by_name(db: Session, name: str):
+    return _get_index(db)["by_name"].get(name)
+
+def get_default(db: Session):
+    return _get_index(db)["default"]
+
+def remember_profile(db: Session, profile: dict):
+    """Mirror a profile TB just returned (e.g. after creating it) without a full sync."""
+    if not profile or not profile.get('id'):
+        return
+    profile_id = profile['id']['id']
+    row = db.query(models.ThingsboardProfile).filter(models.ThingsboardProfile.tb_profile_id == profile_id).first()
+    if not row:
+        row = models.ThingsboardProfile(tb_profile_id=profile_id)
+        db.add(row)
+    row.name = profile.get('name')
+    row.description = profile.get('description')
+    row.is_default = bool(profile.get('default'))
+    row.tb_created_time = profile.get('createdTime')
+    db.commit()
+    reload_index(db)
@@ -0,0 +1,111 @@
+"""
+Server-side ThingsBoard credentials.
+
+The system-admin account (TB_USERNAME / TB_PASSWORD) is logged in once per
+process; the token is refreshed through tb_refresh_token shortly before its
+JWT expiry and handed to every server-side caller.
+"""
+import os
+import threading
+import time
+from . import thingsboard
+from .thingsboard import decode_jwt_payload, jwt_expiry
+
+# Refresh this many seconds before the token expires
+REFRESH_MARGIN = int(os.getenv("TB_TOKEN_REFRESH_MARGIN", "300"))
+
+
+class SystemTokenManager:
+    """Process-wide TB system-admin token with proactive refresh.
+
+    get_token() is safe to call from any thread; when the token is about to
+    expire exactly one caller renews it while the others wait for the result.
+    """
+
+    def __init__(self, username, password, margin=REFRESH_MARGIN):
+        self.username = username
+        self.password = password
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._token = None
+        self._refresh_token = None
+        self._expires_at = 0
+        self.logins = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def _is_fresh(self):
+        return self._token is not None and self._expires_at - self.margin > time.time()
+
+    def get_tokens(self):
+        """{"token", "refreshToken"} of the system admin, or None if TB login fails."""
+        if not self._is_fresh():
+            with self._lock:
+                # Another thread may have renewed while we waited for the lock
+                if not self._is_fresh():
+                    self._renew()
+        if self._token is None:
+            return None
+        return {"token": self._token, "refreshToken": self._refresh_token}
+
+    def get_token(self):
+        tokens = self.get_tokens()
+        return tokens["token"] if tokens else None
+
+    def _renew(self):
+        data = None
+        refresh_exp = jwt_expiry(self._refresh_token)
+        if self._refresh_token and refresh_exp and refresh_exp > time.time():
+            data = thingsboard.tb_refresh_token(self._refresh_token)
+            if data:
+                self.refreshes += 1
+        if not data:
+            data = thingsboard.tb_login(self.username, self.password)
+            if data:
+                self.logins += 1
+        if not data:
+            self.failures += 1
+            print("Failed to obtain ThingsBoard system token")
+            self._token = None
+            self._refresh_token = None
+            self._expires_at = 0
+            return
+        self._token = data["token"]
+        self._refresh_token = data["refreshToken"]
+        # Tokens without a readable exp are treated as short lived
+        self._expires_at = jwt_expiry(self._token) or time.time() + 2 * self.margin
+
+    def invalidate(self, token=None):
+        """Drop the cached tokens, e.g. after TB rejected `token`; the next caller logs in again.
+
+        With `token`, nothing happens unless it is still the cached one, so a
+        late 401 for an old token doesn't throw away its already renewed successor.
+        """
+        with self._lock:
+            if token is not None and token != self._token:
+                return
+            if self._token is not None:
+                print("Dropped rejected ThingsBoard system token")
+            # The refresh token belongs to the same (dead) session
+            self._token = None
+            self._refresh_token = None
+            self._expires_at = 0
+
+    def owns(self, token):
+        """True if `token` was issued to the shared system-admin account."""
+        return bool(token) and decode_jwt_payload(token).get("sub") == self.username
+
+    def stats(self):
+        return {
+            "cached": self._token is not None,
+            "expires_in": max(int(self._expires_at - time.time()), 0) if self._token else 0,
+            "logins": self.logins,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }
+
+
+system_tokens = SystemTokenManager(os.getenv("TB_USERNAME", "admin@nibiaa.com"), os.getenv("TB_PASSWORD", "122333"))
+
+def get_system_token():
+    return system_tokens.get_token()
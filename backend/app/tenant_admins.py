@@ -0,0 +1,32 @@
+"""
+Persisted tenant -> primary Tenant Admin index.
+
+Acting on a tenant's users means impersonating its first created
+TENANT_ADMIN. Instead of listing every user of the tenant to find that
+admin, the choice is stored when the tenant is created (or the first time
+it is resolved) and only re-resolved once TB stops accepting it.
+"""
+from sqlalchemy.orm import Session
+from . import models
+
+
+def get_primary_admin(db: Session, tenant_id: str):
+    return db.query(models.TenantPrimaryAdmin).filter(models.TenantPrimaryAdmin.tenant_id == tenant_id).first()
+
+def remember_primary_admin(db: Session, tenant_id: str, user: dict):
+    """Store `user` (a TB user dict) as the primary admin of the tenant."""
+    if not tenant_id or not user or not user.get('id'):
+        return None
+    row = get_primary_admin(db, tenant_id)
+    if not row:
+        row = models.TenantPrimaryAdmin(tenant_id=tenant_id)
+        db.add(row)
+    row.tb_user_id = user['id']['id']
+    row.email = user.get('email')
+    row.created_time = user.get('createdTime')
+    db.commit()
+    return row
+
+def forget_primary_admin(db: Session, tenant_id: str):
+    db.query(models.TenantPrimaryAdmin).filter(models.TenantPrimaryAdmin.tenant_id == tenant_id).delete()
+    db.commit()
@@ -0,0 +1,60 @@
+"""
+Removal of local data that belongs to tenants deleted in ThingsBoard.
+
+The synced `tenants` table is the set of tenant ids that still exist, so
+orphans are found with NOT EXISTS against it and deleted set-based (task
+comments, tasks, projects, user_tenants) in a single transaction. Runs
+after every background tenant sync and on demand via
+POST /tb/tenants/reconcile.
+"""
+import time
+from sqlalchemy import delete, exists, select
+from sqlalchemy.orm import Session
+from . import models
+
+last_result = None
+
+
+def _orphaned(column):
+    return column.isnot(None) & ~exists().where(models.Tenant.tenant_id == column)
+
+def reconcile_orphans(db: Session):
+    """Delete projects (with their tasks) and user_tenants of tenants missing from the tenants table.
+
+    Does nothing while the tenants table is empty, since then every project
+    would look orphaned.
+    """
+    global last_result
+    if db.query(models.Tenant.id).first() is None:
+        print("Skipping orphan reconciliation: tenants table is empty")
+        return None
+
+    started = time.time()
+    orphan_projects = select(models.Project.id).where(_orphaned(models.Project.tenant_id))
+    orphan_tasks = select(models.Task.id).where(models.Task.project_id.in_(orphan_projects))
+    try:
+        removed_tenants = sorted({r[0] for r in db.execute(
+            select(models.Project.tenant_id).where(_orphaned(models.Project.tenant_id))
+        )})
+        comments = db.execute(delete(models.TaskComment).where(models.TaskComment.task_id.in_(orphan_tasks))).rowcount
+        tasks = db.execute(delete(models.Task).where(models.Task.project_id.in_(orphan_projects))).rowcount
+        projects = db.execute(delete(models.Project).where(_orphaned(models.Project.tenant_id))).rowcount
+        user_tenants = db.execute(delete(models.UserTenant).where(_orphaned(models.UserTenant.tenant_id))).rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    last_result = {
+        "tenants": removed_tenants,
+        "projects": projects,
+        "tasks": tasks,
+        "task_comments": comments,
+        "user_tenants": user_tenants,
+        "finished_at": time.time(),
+        "duration_ms": int((time.time() - started) * 1000),
+    }
+    if projects or user_tenants:
+        print(f"Removed local data of deleted tenants {removed_tenants}: "
+              f"{projects} projects, {tasks} tasks, {comments} task comments, {user_tenants} user_tenants")
+    return last_result
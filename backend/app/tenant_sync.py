@@ -0,0 +1,159 @@
+"""
+Local read model of ThingsBoard tenants.
+
+GET /tb/tenants reads the `tenants` table instead of listing TB on every
+request. A background task re-syncs the table every TB_TENANT_SYNC_INTERVAL
+seconds with the system-admin token; a sync streams the TB tenant list and
+only writes tenants that are new or whose createdTime, title or profile
+changed, then drops tenants TB no longer has. Local data of dropped tenants
+is cleaned up afterwards by tenant_reconcile.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from . import models, thingsboard, tenant_reconcile
+from .database import SessionLocal
+from .tb_tokens import get_system_token
+
+# Seconds between background syncs, 0 disables the background task
+SYNC_INTERVAL = int(os.getenv("TB_TENANT_SYNC_INTERVAL", "300"))
+# Tenant ids per DELETE ... IN (...) statement
+DELETE_CHUNK = 500
+
+_lock = threading.Lock()
+_task = None
+state = {
+    "last_synced_at": None,
+    "last_attempt_at": None,
+    "last_error": None,
+    "last_result": None,
+    "duration_ms": None,
+}
+
+
+def to_tb_tenant(row):
+    return json.loads(row.data)
+
+def _key(created_time, title, profile_id):
+    return (created_time, title, profile_id)
+
+def _apply(row, tenant):
+    row.title = tenant.get('title')
+    row.tenant_profile_id = (tenant.get('tenantProfileId') or {}).get('id')
+    row.created_time = tenant.get('createdTime')
+    row.data = json.dumps(tenant)
+
+def remember_tenant(db: Session, tenant: dict):
+    """Write a tenant TB just returned (after create / update) without waiting for the next sync."""
+    if not tenant or not tenant.get('id'):
+        return None
+    row = db.query(models.Tenant).filter(models.Tenant.tenant_id == tenant['id']['id']).first()
+    if not row:
+        row = models.Tenant(tenant_id=tenant['id']['id'])
+        db.add(row)
+    _apply(row, tenant)
+    db.commit()
+    return row
+
+def sync_tenants(db: Session, token: str):
+    """Bring the tenants table in line with TB; returns counts of what changed.
+
+    Only one sync runs per process at a time. A TB listing that fails midway
+    raises ThingsBoardError before anything is deleted.
+    """
+    with _lock:
+        started = time.time()
+        state["last_attempt_at"] = started
+        try:
+            result = _sync(db, token)
+        except Exception as e:
+            db.rollback()
+            state["last_error"] = str(e)
+            raise
+        state["last_synced_at"] = time.time()
+        state["last_error"] = None
+        state["last_result"] = result
+        state["duration_ms"] = int((time.time() - started) * 1000)
+        if result["created"] or result["updated"] or result["deleted"]:
+            print(f"Synced ThingsBoard tenants in {state['duration_ms']} ms: {result}")
+        return result
+
+def _sync(db: Session, token: str):
+    local = {
+        tenant_id: _key(created_time, title, profile_id)
+        for tenant_id, created_time, title, profile_id in db.query(
+            models.Tenant.tenant_id, models.Tenant.created_time, models.Tenant.title, models.Tenant.tenant_profile_id
+        )
+    }
+    result = {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    seen = set()
+
+    for page in thingsboard.iter_pages(token, "/api/tenants"):
+        for t in page:
+            tenant_id = t['id']['id']
+            seen.add(tenant_id)
+            known = local.get(tenant_id)
+            if known == _key(t.get('createdTime'), t.get('title'), (t.get('tenantProfileId') or {}).get('id')):
+                result["unchanged"] += 1
+                continue
+            if known is None:
+                row = models.Tenant(tenant_id=tenant_id)
+                db.add(row)
+                result["created"] += 1
+            else:
+                row = db.query(models.Tenant).filter(models.Tenant.tenant_id == tenant_id).first()
+                result["updated"] += 1
+            _apply(row, t)
+
+    missing = [tenant_id for tenant_id in local if tenant_id not in seen]
+    for i in range(0, len(missing), DELETE_CHUNK):
+        db.query(models.Tenant).filter(models.Tenant.tenant_id.in_(missing[i:i + DELETE_CHUNK])).delete(synchronize_session=False)
+    result["deleted"] = len(missing)
+
+    db.commit()
+    return result
+
+def status():
+    """Sync state plus the age of the data in seconds (None if never synced by this process)."""
+    synced_at = state["last_synced_at"]
+    return {**state, "age_seconds": int(time.time() - synced_at) if synced_at else None}
+
+def _sync_with_system_token():
+    token = get_system_token()
+    if not token:
+        print("Skipping tenant sync: no ThingsBoard system token")
+        return
+    db = SessionLocal()
+    try:
+        sync_tenants(db, token)
+        # Only after a complete listing, so a failed sync never deletes anything
+        tenant_reconcile.reconcile_orphans(db)
+    except Exception as e:
+        print(f"Tenant sync failed: {e}")
+    finally:
+        db.close()
+
+async def _run_periodically():
+    while True:
+        await run_in_threadpool(_sync_with_system_token)
+        await asyncio.sleep(SYNC_INTERVAL)
+
+def start():
+    """Start the background syncer on the running event loop."""
+    global _task
+    if SYNC_INTERVAL > 0 and _task is None:
+        _task = asyncio.get_running_loop().create_task(_run_periodically())
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -1,7 +1,18 @@
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import base64
+import contextvars
+import hashlib
 import json
 import os
+import time
 from dotenv import load_dotenv
+from .tb_cache import TTLCache
+from . import tb_memo, tb_breaker
 
 load_dotenv()
 
@@ -9,45 +20,323 @@ BASE_URL = os.getenv("TB_BASE_URL")
 if not BASE_URL:
     raise ValueError("TB_BASE_URL must be set in .env")
 
+# HTTP client configuration (all optional, see .env.example)
+POOL_CONNECTIONS = int(os.getenv("TB_POOL_CONNECTIONS", "4"))      # number of per-host pools to keep
+POOL_MAXSIZE = int(os.getenv("TB_POOL_MAXSIZE", "20"))             # keep-alive connections per host
+POOL_BLOCK = os.getenv("TB_POOL_BLOCK", "false").lower() == "true"  # wait for a free connection instead of opening extra ones
+CONNECT_TIMEOUT = float(os.getenv("TB_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("TB_READ_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("TB_MAX_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("TB_RETRY_BACKOFF", "0.5"))
+RETRY_JITTER = float(os.getenv("TB_RETRY_JITTER", "0.5"))  # up to this many random seconds added to each backoff
+PAGE_SIZE = int(os.getenv("TB_PAGE_SIZE", "100"))
+PAGE_CONCURRENCY = int(os.getenv("TB_PAGE_CONCURRENCY", "4"))   # parallel page requests per listing
+ENRICH_CONCURRENCY = int(os.getenv("TB_ENRICH_CONCURRENCY", "10"))  # users enriched in parallel
+CUSTOMER_CONCURRENCY = int(os.getenv("TB_CUSTOMER_CONCURRENCY", "8"))  # customers whose users are listed in parallel
+IMPERSONATION_CACHE_SIZE = int(os.getenv("TB_IMPERSONATION_CACHE_SIZE", "512"))
+CURRENT_USER_CACHE_SIZE = int(os.getenv("TB_CURRENT_USER_CACHE_SIZE", "256"))
+CURRENT_USER_TTL = int(os.getenv("TB_CURRENT_USER_TTL", "300"))
+TENANT_USERS_CACHE_SIZE = int(os.getenv("TB_TENANT_USERS_CACHE_SIZE", "128"))
+TENANT_USERS_FRESH_TTL = int(os.getenv("TB_TENANT_USERS_FRESH_TTL", "30"))    # served without revalidating
+TENANT_USERS_MAX_STALE = int(os.getenv("TB_TENANT_USERS_MAX_STALE", "600"))   # served while revalidating
+TOKEN_EXPIRY_MARGIN = 60  # seconds; cached tokens are dropped this long before their exp
+
+
+def decode_jwt_payload(token):
+    """Claims of a JWT without verifying it (TB signs them, we only need exp/sub/tenantId)."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * ((4 - len(payload) % 4) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except Exception:
+        return {}
+
+def jwt_expiry(token):
+    """exp claim of a JWT as epoch seconds, or None if it can't be read."""
+    exp = decode_jwt_payload(token).get("exp") if token else None
+    return float(exp) if exp else None
+
+def token_ttl(token, cap=None):
+    """Seconds a token may still be cached: until shortly before its exp, at most `cap`."""
+    exp = jwt_expiry(token)
+    ttl = exp - time.time() - TOKEN_EXPIRY_MARGIN if exp else 0
+    if cap is not None:
+        ttl = min(ttl, cap)
+    return ttl
+
+# Impersonation tokens (/api/user/{id}/token) keyed by (hash of the requesting token, impersonated user id):
+# a cached token is only handed to a caller holding the very token TB issued it for
+impersonation_tokens = TTLCache(maxsize=IMPERSONATION_CACHE_SIZE)
+
+# /api/auth/user answers keyed by token hash; an entry lives at most CURRENT_USER_TTL
+# seconds and never past the token's own expiry
+current_users = TTLCache(maxsize=CURRENT_USER_CACHE_SIZE, ttl=CURRENT_USER_TTL)
+
+def token_key(token):
+    return hashlib.sha256(token.encode()).hexdigest() if token else None
+
+def remember_current_user(token, user):
+    current_users.set(token_key(token), user, token_ttl(token, cap=CURRENT_USER_TTL))
+    return user
+
+def token_from_headers(headers):
+    auth_header = headers.get("X-Authorization") or ""
+    return auth_header[len("Bearer "):] if auth_header.startswith("Bearer ") else None
+
+def forget_rejected_token(token):
+    """TB answered 401 for `token`: drop it from every cache that could hand it out again."""
+    if not token:
+        return
+    if impersonation_tokens.discard_value(token):
+        print("Evicted rejected impersonation token from cache")
+    current_users.pop(token_key(token))
+    from .tb_tokens import system_tokens  # tb_tokens imports this module
+    if system_tokens.owns(token):
+        system_tokens.invalidate(token)
+
+def _evict_on_unauthorized(response, *args, **kwargs):
+    if response.status_code == 401:
+        forget_rejected_token(token_from_headers(response.request.headers))
+    return response
+
+# Headers that no longer describe a body replayed from the request memo (it is stored decoded)
+MEMO_DROPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+def memo_headers(headers):
+    return [(k, v) for k, v in headers.items() if k.lower() not in MEMO_DROPPED_HEADERS]
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies the configured timeouts when a call doesn't pass its own.
+
+    Inside an API request, identical GETs are answered from the request memo (tb_memo).
+    Calls go through the circuit breaker of their TB base URL (tb_breaker).
+    """
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = (CONNECT_TIMEOUT, READ_TIMEOUT)
+        memo = tb_memo.current()
+        if memo is None:
+            return self._send_guarded(request, **kwargs)
+        if request.method != "GET":
+            memo.invalidate()
+            return self._send_guarded(request, **kwargs)
+
+        key = tb_memo.request_key(request.method, request.url, request.headers)
+        hit = memo.lookup(key)
+        if hit is not None:
+            return self._replay(request, hit)
+        response = self._send_guarded(request, **kwargs)
+        memo.store(key, response.status_code, memo_headers(response.headers), response.content, response.reason)
+        return response
+
+    def _send_guarded(self, request, **kwargs):
+        # The breaker sees the outcome after urllib3's retries
+        breaker = tb_breaker.get_breaker(request.url)
+        breaker.before_call()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_status(response.status_code)
+        return response
+
+    def _replay(self, request, hit):
+        status_code, headers, content, reason = hit
+        response = requests.Response()
+        response.status_code = status_code
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+
+class _CountingRetry(Retry):
+    """Retry that counts the retries it grants, for /tb/client/stats."""
+
+    def increment(self, *args, **kwargs):
+        new_retry = super().increment(*args, **kwargs)
+        tb_breaker.retry_counts["sync"] += 1
+        return new_retry
+
+
+def _build_session():
+    # Connection errors are retried for every method (the request never reached TB),
+    # read errors and 502/503/504 only for GETs. Backoff is jittered so callers that
+    # failed together don't retry together.
+    retry_options = dict(
+        total=MAX_RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    try:
+        retry = _CountingRetry(backoff_jitter=RETRY_JITTER, **retry_options)
+    except TypeError:  # urllib3 < 2 has no backoff_jitter
+        retry = _CountingRetry(**retry_options)
+    adapter = _TimeoutHTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        pool_block=POOL_BLOCK,
+        max_retries=retry,
+    )
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.hooks["response"].append(_evict_on_unauthorized)
+    return s
+
+# Shared keep-alive session used by every call in this module
+session = _build_session()
+
+def get_pool_stats():
+    """Connection pool statistics of the shared session, one entry per TB host."""
+    stats = []
+    adapter = session.get_adapter(BASE_URL)
+    pools = adapter.poolmanager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        opened = pool.num_connections
+        requests_made = pool.num_requests
+        stats.append({
+            "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+            "connections_opened": opened,
+            "connections_reused": max(requests_made - opened, 0),
+            "requests": requests_made,
+            "idle_connections": sum(1 for c in list(pool.pool.queue) if c is not None) if pool.pool is not None else 0,
+            "max_size": POOL_MAXSIZE,
+        })
+    return stats
+
 def get_headers(token):
     return {
         "Content-Type": "application/json",
         "X-Authorization": f"Bearer {token}"
     }
 
-def fetch_all_pages(token, url_path, params=None):
+class ThingsBoardError(Exception):
+    """A ThingsBoard listing could not be read completely.
+
+    failed_pages maps page number -> error text, partial holds whatever was fetched.
+    """
+
+    def __init__(self, message, url_path=None, failed_pages=None, partial=None, status_code=None):
+        super().__init__(message)
+        self.url_path = url_path
+        self.failed_pages = failed_pages or {}
+        self.partial = partial or []
+        self.status_code = status_code
+
+def fetch_page(token, url_path, params, page, page_size=None):
+    current_params = params.copy()
+    current_params['pageSize'] = page_size or PAGE_SIZE
+    current_params['page'] = page
+    response = session.get(f"{BASE_URL}{url_path}", headers=get_headers(token), params=current_params)
+    if response.status_code != 200:
+        raise ThingsBoardError(
+            f"ThingsBoard returned {response.status_code} for {url_path} page {page}: {response.text[:200]}",
+            url_path=url_path,
+            failed_pages={page: f"HTTP {response.status_code}"},
+            status_code=response.status_code,
+        )
+    return response.json()
+
+def collect_pages(url_path, first, pages, errors, total_pages):
+    """Join pages in order, raising ThingsBoardError if any of them failed."""
+    all_data = list(first.get('data', []))
+    for page in range(1, total_pages):
+        all_data.extend(pages.get(page, []))
+    if errors:
+        for page, err in sorted(errors.items()):
+            print(f"Error fetching page {page} for {url_path}: {err}")
+        raise ThingsBoardError(
+            f"Failed to fetch {len(errors)} of {total_pages} pages of {url_path}",
+            url_path=url_path,
+            failed_pages=errors,
+            partial=all_data,
+        )
+    return all_data
+
+def submit_in_context(pool, fn, *args):
+    """pool.submit(fn, *args) run in a copy of the caller's context.
+
+    The pool thread then sees the caller's ContextVars, e.g. the request memo.
+    Every call gets its own copy: a context can't be entered by two threads at once.
+    """
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+def fetch_all_pages(token, url_path, params=None, concurrency=None):
+    """Fetch every page of a TB list endpoint.
+
+    Page 0 tells us totalPages; the rest are fetched concurrently (at most
+    `concurrency` at a time, TB_PAGE_CONCURRENCY by default) and returned in order.
+    """
     if params is None:
         params = {}
-    
-    all_data = []
+
+    try:
+        first = fetch_page(token, url_path, params, 0)
+    except (ThingsBoardError, tb_breaker.CircuitOpenError):
+        raise
+    except Exception as e:
+        raise ThingsBoardError(f"Error fetching page 0 for {url_path}: {e}", url_path=url_path, failed_pages={0: str(e)})
+
+    total_pages = first.get('totalPages') or 1
+    pages = {}
+    errors = {}
+    remaining = list(range(1, total_pages))
+    if remaining:
+        workers = max(1, min(concurrency or PAGE_CONCURRENCY, len(remaining)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {submit_in_context(pool, fetch_page, token, url_path, params, page): page for page in remaining}
+            for future in as_completed(futures):
+                page = futures[future]
+                try:
+                    pages[page] = future.result().get('data', [])
+                except tb_breaker.CircuitOpenError:
+                    # TB is down: fail fast (503) instead of returning a partial listing
+                    raise
+                except Exception as e:
+                    errors[page] = str(e)
+
+    return collect_pages(url_path, first, pages, errors, total_pages)
+
+def iter_pages(token, url_path, params=None, page_size=None):
+    """Yield the records of a TB list endpoint one page at a time.
+
+    Unlike fetch_all_pages nothing is accumulated, so callers can act on the
+    first page while later ones are still on the server. Raises
+    ThingsBoardError at the page that fails.
+    """
+    if params is None:
+        params = {}
+
     page = 0
     has_next = True
-    
     while has_next:
-        current_params = params.copy()
-        current_params['pageSize'] = 100
-        current_params['page'] = page
-        
         try:
-            response = requests.get(f"{BASE_URL}{url_path}", headers=get_headers(token), params=current_params)
-            if response.status_code == 200:
-                res_json = response.json()
-                all_data.extend(res_json.get('data', []))
-                has_next = res_json.get('hasNext', False)
-                page += 1
-            else:
-                has_next = False
+            res_json = fetch_page(token, url_path, params, page, page_size)
+        except (ThingsBoardError, tb_breaker.CircuitOpenError):
+            raise
         except Exception as e:
-            print(f"Error fetching page {page} for {url_path}: {e}")
-            has_next = False
-            
-    return all_data
+            raise ThingsBoardError(f"Error fetching page {page} for {url_path}: {e}", url_path=url_path, failed_pages={page: str(e)})
+        has_next = res_json.get('hasNext', False)
+        page += 1
+        yield res_json.get('data', [])
 
 def tb_login(username, password):
 
     url = f"{BASE_URL}/api/auth/login"
     try:
-        response = requests.post(url, json={"username": username, "password": password})
+        response = session.post(url, json={"username": username, "password": password})
         if response.status_code == 200:
             data = response.json()
             return {"token": data["token"], "refreshToken": data["refreshToken"]}
@@ -55,21 +344,10 @@ def tb_login(username, password):
         print(f"TB Login Error: {e}")
         return None
 
-def get_current_tb_user(token):
-    url = f"{BASE_URL}/api/auth/user"
-    try:
-        response = requests.get(url, headers=get_headers(token))
-        if response.status_code == 200:
-            return response.json()
-    except Exception as e:
-        print(f"Error fetching current TB user: {e}")
-    return None
-    return None
-
 def tb_refresh_token(refresh_token):
     url = f"{BASE_URL}/api/auth/token"
     try:
-        response = requests.post(url, json={"refreshToken": refresh_token})
+        response = session.post(url, json={"refreshToken": refresh_token})
         if response.status_code == 200:
             data = response.json()
             return {"token": data["token"], "refreshToken": data["refreshToken"]}
@@ -80,7 +358,7 @@ def tb_refresh_token(refresh_token):
 def tb_logout(token):
     url = f"{BASE_URL}/api/auth/logout"
     try:
-        requests.post(url, headers=get_headers(token))
+        session.post(url, headers=get_headers(token))
     except Exception:
         pass
 
@@ -99,12 +377,19 @@ def get_tenant_users(token, tenant_id):
     return fetch_all_pages(token, f"/api/tenant/{tenant_id}/users")
 
 
+def remember_user_token(sys_token, user_id, token):
+    impersonation_tokens.set((token_key(sys_token), user_id), token, token_ttl(token))
+    return token
+
 def get_user_token(sys_token, user_id):
+    cached = impersonation_tokens.get((token_key(sys_token), user_id))
+    if cached:
+        return cached
     url = f"{BASE_URL}/api/user/{user_id}/token"
     try:
-        response = requests.get(url, headers=get_headers(sys_token))
+        response = session.get(url, headers=get_headers(sys_token))
         if response.status_code == 200:
-            return response.json()['token']
+            return remember_user_token(sys_token, user_id, response.json()['token'])
         print(f"Failed to get user token: {response.status_code} - {response.text}")
     except Exception as e:
         print(f"Exception getting user token: {e}")
@@ -113,7 +398,7 @@ def get_user_token(sys_token, user_id):
 def get_user_by_id(token, user_id):
     url = f"{BASE_URL}/api/user/{user_id}"
     try:
-        response = requests.get(url, headers=get_headers(token))
+        response = session.get(url, headers=get_headers(token))
         if response.status_code == 200:
             return response.json()
         print(f"Failed to get user {user_id}: {response.status_code} - {response.text}")
@@ -122,44 +407,98 @@ def get_user_by_id(token, user_id):
     return None
 
 def get_current_tb_user(token):
+    cached = current_users.get(token_key(token))
+    if cached:
+        return cached
     url = f"{BASE_URL}/api/auth/user"
     try:
-        response = requests.get(url, headers=get_headers(token))
+        response = session.get(url, headers=get_headers(token))
         if response.status_code == 200:
-            return response.json()
+            return remember_current_user(token, response.json())
         print(f"Failed to get current user: {response.status_code} - {response.text}")
     except Exception as e:
         print(f"Exception getting current user: {e}")
     return None
 
-def enrich_users_with_details(token, users):
-    for u in users:
-        try:
-            user_id = u['id']['id']
-            
-            # 1. Fetch User Details (for additionalInfo)
-            detail_url = f"{BASE_URL}/api/user/{user_id}"
-            detail_res = requests.get(detail_url, headers=get_headers(token))
+def _enrich_user(token, u, details=True, credentials=True):
+    """Enrich one user in place -> (calls made, detail calls skipped, failed)."""
+    calls = skipped = 0
+    try:
+        user_id = u['id']['id']
+        
+        # 1. Fetch User Details (for additionalInfo), unless the listing already carried it
+        if details and u.get('additionalInfo') is None:
+            calls += 1
+            detail_res = session.get(f"{BASE_URL}/api/user/{user_id}", headers=get_headers(token))
             if detail_res.status_code == 200:
                 real_user = detail_res.json()
                 if 'additionalInfo' in real_user:
                     u['additionalInfo'] = real_user['additionalInfo']
-            
-            # 2. Fetch Credentials (for Real Active Status)
-            cred_url = f"{BASE_URL}/api/user/{user_id}/credentials"
-            cred_res = requests.get(cred_url, headers=get_headers(token))
+        elif details:
+            skipped += 1
+        
+        # 2. Fetch Credentials (for Real Active Status)
+        if credentials:
+            calls += 1
+            cred_res = session.get(f"{BASE_URL}/api/user/{user_id}/credentials", headers=get_headers(token))
             if cred_res.status_code == 200:
                 creds = cred_res.json()
                 if 'additionalInfo' not in u or u['additionalInfo'] is None:
                     u['additionalInfo'] = {}
                 # Store the real status in additionalInfo so frontend can read it
                 u['additionalInfo']['userCredentialsEnabled'] = creds.get('enabled', False)
-                
-        except Exception as e:
-            print(f"Error enriching user {u.get('email')}: {e}")
-            pass
+    except Exception as e:
+        print(f"Error enriching user {u.get('email')}: {e}")
+        return calls, skipped, 1
+    return calls, skipped, 0
+
+def summarize_enrichment(users, results, stats=None):
+    counts = {
+        "users": len(users),
+        "calls": sum(r[0] for r in results),
+        "skipped": sum(r[1] for r in results),
+        "errors": sum(r[2] for r in results),
+    }
+    print(f"Enriched {counts['users']} users: {counts['calls']} TB calls, {counts['skipped']} detail calls skipped, {counts['errors']} errors")
+    if stats is not None:
+        stats.update(counts)
+    return counts
+
+def enrich_users_with_details(token, users, concurrency=None, stats=None, details=True, credentials=True):
+    """Add additionalInfo (details) and the real credentials state (credentials) to each user.
+
+    Users are enriched concurrently by at most `concurrency` workers
+    (TB_ENRICH_CONCURRENCY). Call counts are logged and, if given, written to `stats`.
+    """
+    if not users:
+        summarize_enrichment(users, [], stats)
+        return users
+    workers = max(1, min(concurrency or ENRICH_CONCURRENCY, len(users)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [submit_in_context(pool, _enrich_user, token, u, details, credentials) for u in users]
+        results = [f.result() for f in futures]
+    summarize_enrichment(users, results, stats)
     return users
 
+def get_credentials_enabled(token, user_ids, concurrency=None):
+    """Return {user_id: enabled} for the given users; users whose credentials can't be read are left out."""
+    def fetch(user_id):
+        try:
+            response = session.get(f"{BASE_URL}/api/user/{user_id}/credentials", headers=get_headers(token))
+            if response.status_code == 200:
+                return user_id, response.json().get('enabled', False)
+            print(f"Failed to get credentials of user {user_id}: {response.status_code} - {response.text}")
+        except Exception as e:
+            print(f"Exception getting credentials of user {user_id}: {e}")
+        return user_id, None
+
+    if not user_ids:
+        return {}
+    workers = max(1, min(concurrency or ENRICH_CONCURRENCY, len(user_ids)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = [f.result() for f in [submit_in_context(pool, fetch, user_id) for user_id in user_ids]]
+    return {user_id: enabled for user_id, enabled in results if enabled is not None}
+
 
 def get_all_user_infos(token):
     users = fetch_all_pages(token, "/api/userInfos/all")
@@ -177,25 +516,21 @@ def get_tenant_admins(token):
     # Actually, /api/users returns all users in scope.
     return fetch_all_pages(token, "/api/users", params={"sortProperty": "createdTime", "sortOrder": "DESC"})
 
+def pick_first_tenant_admin(users):
+    """The first created TENANT_ADMIN of a list of users, or None."""
+    tenant_admins = [u for u in users if u.get('authority') == 'TENANT_ADMIN']
+    if not tenant_admins:
+        return None
+    return min(tenant_admins, key=lambda x: x.get('createdTime') or float('inf'))
+
 def get_first_tenant_admin(token, tenant_id):
     # Get all users of tenant
-    users = get_tenant_users(token, tenant_id)
-    
-    # Filter for TENANT_ADMIN
-    tenant_admins = [u for u in users if u['authority'] == 'TENANT_ADMIN']
-    
-    # Sort by createdTime (Oldest First)
-    tenant_admins.sort(key=lambda x: x.get('createdTime', float('inf')))
-    
-    if tenant_admins:
-        return tenant_admins[0]
-    return None
+    return pick_first_tenant_admin(get_tenant_users(token, tenant_id))
 
 
 
-def create_tenant_profile(token, name, description=None):
-    url = f"{BASE_URL}/api/tenantProfile"
-    payload = {
+def build_tenant_profile_payload(name, description=None):
+    return {
         "name": name,
         "description": description,
         "isolatedTbRuleEngine": False,
@@ -219,8 +554,12 @@ def create_tenant_profile(token, name, description=None):
             }
         }
     }
+
+def create_tenant_profile(token, name, description=None):
+    url = f"{BASE_URL}/api/tenantProfile"
+    payload = build_tenant_profile_payload(name, description)
     try:
-        response = requests.post(url, json=payload, headers=get_headers(token))
+        response = session.post(url, json=payload, headers=get_headers(token))
         if response.status_code == 200:
             return response.json()
         else:
@@ -229,8 +568,7 @@ def create_tenant_profile(token, name, description=None):
         print(f"Exception creating tenant profile: {e}")
     return None
 
-def create_tenant(token, title, profile_id=None, use_case=None, email=None):
-    url = f"{BASE_URL}/api/tenant"
+def build_tenant_payload(title, profile_id=None, use_case=None, email=None):
     payload = {"title": title}
     if email:
         payload["email"] = email
@@ -239,9 +577,14 @@ def create_tenant(token, title, profile_id=None, use_case=None, email=None):
     
     if use_case:
         payload["additionalInfo"] = {"useCase": use_case}
+    return payload
+
+def create_tenant(token, title, profile_id=None, use_case=None, email=None):
+    url = f"{BASE_URL}/api/tenant"
+    payload = build_tenant_payload(title, profile_id, use_case, email)
 
     try:
-        response = requests.post(url, json=payload, headers=get_headers(token))
+        response = session.post(url, json=payload, headers=get_headers(token))
         if response.status_code == 200:
             return response.json()
     except Exception:
@@ -256,7 +599,7 @@ def update_tenant(token, tenant_id, title, profile_id):
         "tenantProfileId": {"id": profile_id, "entityType": "TENANT_PROFILE"}
     }
     try:
-        response = requests.post(url, json=payload, headers=get_headers(token))
+        response = session.post(url, json=payload, headers=get_headers(token))
         if response.status_code == 200:
             return response.json()
     except Exception as e:
@@ -266,8 +609,7 @@ def update_tenant(token, tenant_id, title, profile_id):
 def create_tenant_admin(token, tenant_id, email, first_name, last_name, send_activation_mail=True):
     return create_user(token, email, first_name, last_name, "TENANT_ADMIN", tenant_id=tenant_id, send_activation_mail=send_activation_mail)
 
-def create_user(token, email, first_name, last_name, authority, tenant_id=None, customer_id=None, send_activation_mail=True):
-    url = f"{BASE_URL}/api/user?sendActivationMail={str(send_activation_mail).lower()}"
+def build_user_payload(email, first_name, last_name, authority, tenant_id=None, customer_id=None):
     payload = {
         "email": email,
         "authority": authority,
@@ -280,9 +622,14 @@ def create_user(token, email, first_name, last_name, authority, tenant_id=None,
         
     if customer_id:
         payload["customerId"] = {"id": customer_id, "entityType": "CUSTOMER"}
-        
+    return payload
+
+def create_user(token, email, first_name, last_name, authority, tenant_id=None, customer_id=None, send_activation_mail=True):
+    url = f"{BASE_URL}/api/user?sendActivationMail={str(send_activation_mail).lower()}"
+    payload = build_user_payload(email, first_name, last_name, authority, tenant_id, customer_id)
+
     try:
-        response = requests.post(url, json=payload, headers=get_headers(token))
+        response = session.post(url, json=payload, headers=get_headers(token))
         if response.status_code == 200:
             return response.json()
         else:
@@ -294,7 +641,7 @@ def create_user(token, email, first_name, last_name, authority, tenant_id=None,
 def get_activation_link(token, user_id):
     url = f"{BASE_URL}/api/user/{user_id}/activationLink"
     try:
-        response = requests.get(url, headers=get_headers(token))
+        response = session.get(url, headers=get_headers(token))
         if response.status_code == 200:
             return response.text
         else:
@@ -307,7 +654,7 @@ def toggle_user_credentials(token, user_id, enabled):
     headers = get_headers(token)
     cred_url = f"{BASE_URL}/api/user/{user_id}/userCredentialsEnabled?userCredentialsEnabled={str(enabled).lower()}"
     try:
-        response = requests.post(cred_url, headers=headers)
+        response = session.post(cred_url, headers=headers)
         if response.status_code == 200:
             return {"success": True}
         else:
@@ -0,0 +1,485 @@
+"""
+Asyncio ThingsBoard client.
+
+Same functions and return values as app/thingsboard.py, built on a shared
+httpx.AsyncClient so route handlers can await TB round trips instead of
+holding a threadpool worker for each one.
+"""
+import asyncio
+import os
+import random
+import httpx
+from .thingsboard import (
+    BASE_URL,
+    POOL_MAXSIZE,
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    MAX_RETRIES,
+    RETRY_BACKOFF,
+    RETRY_JITTER,
+    PAGE_SIZE,
+    PAGE_CONCURRENCY,
+    ENRICH_CONCURRENCY,
+    CUSTOMER_CONCURRENCY,
+    ThingsBoardError,
+    collect_pages,
+    summarize_enrichment,
+    pick_first_tenant_admin,
+    impersonation_tokens,
+    remember_user_token,
+    current_users,
+    token_key,
+    remember_current_user,
+    forget_rejected_token,
+    token_from_headers,
+    get_headers,
+    build_tenant_profile_payload,
+    build_tenant_payload,
+    build_user_payload,
+    memo_headers,
+)
+from . import tb_memo, tb_breaker
+
+# Upper bound of simultaneously open sockets to TB; idle ones above POOL_MAXSIZE are closed
+MAX_CONNECTIONS = int(os.getenv("TB_ASYNC_MAX_CONNECTIONS", "100"))
+
+_client = None
+_client_loop = None
+
+def get_client():
+    """Return the shared AsyncClient, creating it on first use (one per event loop)."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client_loop = loop
+        _client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=POOL_MAXSIZE),
+            transport=_MemoTransport(_ResilientTransport(httpx.AsyncHTTPTransport(retries=MAX_RETRIES))),
+            event_hooks={"response": [_evict_on_unauthorized]},
+        )
+    return _client
+
+# Gateway answers worth retrying for a GET
+RETRY_STATUSES = (502, 503, 504)
+
+class _ResilientTransport(httpx.AsyncBaseTransport):
+    """Circuit breaker (tb_breaker) and jittered retries for GETs.
+
+    GETs are retried on timeouts, dropped connections and 502/503/504 with
+    exponential backoff plus up to RETRY_JITTER random seconds. Failed
+    connects of any method are already retried by the wrapped transport.
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    async def handle_async_request(self, request):
+        # Like the sync client, the breaker sees one outcome per call, after the retries
+        breaker = tb_breaker.get_breaker(request.url)
+        breaker.before_call()
+        attempts = MAX_RETRIES + 1 if request.method == "GET" else 1
+        for attempt in range(attempts):
+            last_attempt = attempt + 1 >= attempts
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError:
+                if last_attempt:
+                    breaker.record_failure()
+                    raise
+            else:
+                if last_attempt or response.status_code not in RETRY_STATUSES:
+                    breaker.record_status(response.status_code)
+                    return response
+                await response.aclose()
+            tb_breaker.retry_counts["async"] += 1
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt + random.uniform(0, RETRY_JITTER))
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+class _MemoTransport(httpx.AsyncBaseTransport):
+    """Answers identical GETs within one API request from the request memo (tb_memo).
+
+    A GET that is already on its way is awaited rather than sent again.
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    async def handle_async_request(self, request):
+        memo = tb_memo.current()
+        if memo is None:
+            return await self._transport.handle_async_request(request)
+        if request.method != "GET":
+            memo.invalidate()
+            return await self._transport.handle_async_request(request)
+
+        key = tb_memo.request_key(request.method, request.url, request.headers)
+        hit = memo.lookup(key)
+        if hit is None and key in memo.inflight:
+            hit = await asyncio.shield(memo.inflight[key])
+            if hit is not None:
+                memo.count_shared()
+        if hit is not None:
+            status_code, headers, content, reason = hit
+            extensions = {"reason_phrase": reason} if reason else None
+            return httpx.Response(status_code, headers=headers, content=content, request=request, extensions=extensions)
+
+        future = asyncio.get_running_loop().create_future()
+        memo.inflight[key] = future
+        snapshot = None
+        try:
+            response = await self._transport.handle_async_request(request)
+            content = await response.aread()
+            if response.status_code == 200:
+                snapshot = (response.status_code, memo_headers(response.headers), content, response.extensions.get("reason_phrase"))
+                memo.store(key, *snapshot)
+            return response
+        finally:
+            future.set_result(snapshot)
+            if memo.inflight.get(key) is future:
+                del memo.inflight[key]
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+async def _evict_on_unauthorized(response):
+    if response.status_code == 401:
+        forget_rejected_token(token_from_headers(response.request.headers))
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def fetch_page(token, url_path, params, page, page_size=None):
+    current_params = params.copy()
+    current_params['pageSize'] = page_size or PAGE_SIZE
+    current_params['page'] = page
+    response = await get_client().get(url_path, headers=get_headers(token), params=current_params)
+    if response.status_code != 200:
+        raise ThingsBoardError(
+            f"ThingsBoard returned {response.status_code} for {url_path} page {page}: {response.text[:200]}",
+            url_path=url_path,
+            failed_pages={page: f"HTTP {response.status_code}"},
+            status_code=response.status_code,
+        )
+    return response.json()
+
+async def fetch_all_pages(token, url_path, params=None, concurrency=None):
+    """Fetch page 0, then the remaining totalPages concurrently (bounded), in order."""
+    if params is None:
+        params = {}
+
+    try:
+        first = await fetch_page(token, url_path, params, 0)
+    except (ThingsBoardError, tb_breaker.CircuitOpenError):
+        raise
+    except Exception as e:
+        raise ThingsBoardError(f"Error fetching page 0 for {url_path}: {e}", url_path=url_path, failed_pages={0: str(e)})
+
+    total_pages = first.get('totalPages') or 1
+    pages = {}
+    errors = {}
+    semaphore = asyncio.Semaphore(concurrency or PAGE_CONCURRENCY)
+
+    async def fetch(page):
+        async with semaphore:
+            try:
+                pages[page] = (await fetch_page(token, url_path, params, page)).get('data', [])
+            except tb_breaker.CircuitOpenError:
+                # TB is down: fail fast (503) instead of returning a partial listing
+                raise
+            except Exception as e:
+                errors[page] = str(e)
+
+    await asyncio.gather(*(fetch(page) for page in range(1, total_pages)))
+    return collect_pages(url_path, first, pages, errors, total_pages)
+
+async def iter_pages(token, url_path, params=None, page_size=None):
+    """Async generator yielding the records of each page as it arrives.
+
+    The next page is requested while the caller is still working on the
+    current one, so at most two pages are held in memory.
+    """
+    if params is None:
+        params = {}
+
+    page = 0
+    pending = asyncio.create_task(fetch_page(token, url_path, params, page, page_size))
+    try:
+        while pending is not None:
+            try:
+                res_json = await pending
+            except (ThingsBoardError, tb_breaker.CircuitOpenError):
+                raise
+            except Exception as e:
+                raise ThingsBoardError(f"Error fetching page {page} for {url_path}: {e}", url_path=url_path, failed_pages={page: str(e)})
+            pending = None
+            if res_json.get('hasNext', False):
+                page += 1
+                pending = asyncio.create_task(fetch_page(token, url_path, params, page, page_size))
+            yield res_json.get('data', [])
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+async def tb_login(username, password):
+    try:
+        response = await get_client().post("/api/auth/login", json={"username": username, "password": password})
+        if response.status_code == 200:
+            data = response.json()
+            return {"token": data["token"], "refreshToken": data["refreshToken"]}
+    except Exception as e:
+        print(f"TB Login Error: {e}")
+    return None
+
+async def tb_refresh_token(refresh_token):
+    try:
+        response = await get_client().post("/api/auth/token", json={"refreshToken": refresh_token})
+        if response.status_code == 200:
+            data = response.json()
+            return {"token": data["token"], "refreshToken": data["refreshToken"]}
+    except Exception as e:
+        print(f"TB Refresh Error: {e}")
+    return None
+
+async def tb_logout(token):
+    try:
+        await get_client().post("/api/auth/logout", headers=get_headers(token))
+    except Exception:
+        pass
+
+async def get_tenant_profiles(token):
+    return await fetch_all_pages(token, "/api/tenantProfiles")
+
+async def list_tenants(token):
+    data = await fetch_all_pages(token, "/api/tenants")
+    # Sort by createdTime descending (Latest First)
+    data.sort(key=lambda x: x.get('createdTime', 0), reverse=True)
+    return data
+
+async def get_tenant_users(token, tenant_id):
+    return await fetch_all_pages(token, f"/api/tenant/{tenant_id}/users")
+
+async def get_user_token(sys_token, user_id):
+    cached = impersonation_tokens.get((token_key(sys_token), user_id))
+    if cached:
+        return cached
+    try:
+        response = await get_client().get(f"/api/user/{user_id}/token", headers=get_headers(sys_token))
+        if response.status_code == 200:
+            return remember_user_token(sys_token, user_id, response.json()['token'])
+        print(f"Failed to get user token: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Exception getting user token: {e}")
+    return None
+
+async def get_user_by_id(token, user_id):
+    try:
+        response = await get_client().get(f"/api/user/{user_id}", headers=get_headers(token))
+        if response.status_code == 200:
+            return response.json()
+        print(f"Failed to get user {user_id}: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Exception getting user {user_id}: {e}")
+    return None
+
+async def get_current_tb_user(token):
+    cached = current_users.get(token_key(token))
+    if cached:
+        return cached
+    try:
+        response = await get_client().get("/api/auth/user", headers=get_headers(token))
+        if response.status_code == 200:
+            return remember_current_user(token, response.json())
+        print(f"Failed to get current user: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Exception getting current user: {e}")
+    return None
+
+async def _enrich_user(token, u, details=True, credentials=True):
+    """Enrich one user in place -> (calls made, detail calls skipped, failed)."""
+    client = get_client()
+    calls = skipped = 0
+    try:
+        user_id = u['id']['id']
+
+        # 1. Fetch User Details (for additionalInfo), unless the listing already carried it
+        if details and u.get('additionalInfo') is None:
+            calls += 1
+            detail_res = await client.get(f"/api/user/{user_id}", headers=get_headers(token))
+            if detail_res.status_code == 200:
+                real_user = detail_res.json()
+                if 'additionalInfo' in real_user:
+                    u['additionalInfo'] = real_user['additionalInfo']
+        elif details:
+            skipped += 1
+
+        # 2. Fetch Credentials (for Real Active Status)
+        if credentials:
+            calls += 1
+            cred_res = await client.get(f"/api/user/{user_id}/credentials", headers=get_headers(token))
+            if cred_res.status_code == 200:
+                creds = cred_res.json()
+                if 'additionalInfo' not in u or u['additionalInfo'] is None:
+                    u['additionalInfo'] = {}
+                # Store the real status in additionalInfo so frontend can read it
+                u['additionalInfo']['userCredentialsEnabled'] = creds.get('enabled', False)
+    except Exception as e:
+        print(f"Error enriching user {u.get('email')}: {e}")
+        return calls, skipped, 1
+    return calls, skipped, 0
+
+async def enrich_users_with_details(token, users, concurrency=None, stats=None, details=True, credentials=True):
+    """Enrich users concurrently, at most `concurrency` (TB_ENRICH_CONCURRENCY) at a time."""
+    semaphore = asyncio.Semaphore(concurrency or ENRICH_CONCURRENCY)
+
+    async def enrich(u):
+        async with semaphore:
+            return await _enrich_user(token, u, details, credentials)
+
+    results = await asyncio.gather(*(enrich(u) for u in users))
+    summarize_enrichment(users, results, stats)
+    return users
+
+async def get_credentials_enabled(token, user_ids, concurrency=None):
+    """Return {user_id: enabled} for the given users; users whose credentials can't be read are left out."""
+    semaphore = asyncio.Semaphore(concurrency or ENRICH_CONCURRENCY)
+
+    async def fetch(user_id):
+        async with semaphore:
+            try:
+                response = await get_client().get(f"/api/user/{user_id}/credentials", headers=get_headers(token))
+                if response.status_code == 200:
+                    return user_id, response.json().get('enabled', False)
+                print(f"Failed to get credentials of user {user_id}: {response.status_code} - {response.text}")
+            except Exception as e:
+                print(f"Exception getting credentials of user {user_id}: {e}")
+            return user_id, None
+
+    results = await asyncio.gather(*(fetch(user_id) for user_id in user_ids))
+    return {user_id: enabled for user_id, enabled in results if enabled is not None}
+
+async def get_all_user_infos(token):
+    users = await fetch_all_pages(token, "/api/userInfos/all")
+    return await enrich_users_with_details(token, users)
+
+async def get_customers(token):
+    return await fetch_all_pages(token, "/api/customers")
+
+async def get_customer_users(token, customer_id):
+    return await fetch_all_pages(token, f"/api/customer/{customer_id}/users")
+
+async def iter_customer_users(token, customers, concurrency=None):
+    """Yield (customer, users) for each customer as soon as its listing finishes.
+
+    At most `concurrency` customers are listed at once; the order follows
+    completion, not the input.
+    """
+    semaphore = asyncio.Semaphore(concurrency or CUSTOMER_CONCURRENCY)
+
+    async def fetch(c):
+        async with semaphore:
+            return c, await get_customer_users(token, c['id']['id'])
+
+    tasks = [asyncio.ensure_future(fetch(c)) for c in customers]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The consumer stopped early or a listing failed: don't leave the rest running
+        for t in tasks:
+            t.cancel()
+
+async def get_tenant_admins(token):
+    return await fetch_all_pages(token, "/api/users", params={"sortProperty": "createdTime", "sortOrder": "DESC"})
+
+async def get_first_tenant_admin(token, tenant_id):
+    return pick_first_tenant_admin(await get_tenant_users(token, tenant_id))
+
+async def create_tenant_profile(token, name, description=None):
+    payload = build_tenant_profile_payload(name, description)
+    try:
+        response = await get_client().post("/api/tenantProfile", json=payload, headers=get_headers(token))
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Failed to create tenant profile: {response.text}")
+    except Exception as e:
+        print(f"Exception creating tenant profile: {e}")
+    return None
+
+async def create_tenant(token, title, profile_id=None, use_case=None, email=None):
+    payload = build_tenant_payload(title, profile_id, use_case, email)
+    try:
+        response = await get_client().post("/api/tenant", json=payload, headers=get_headers(token))
+        if response.status_code == 200:
+            return response.json()
+    except Exception as e:
+        print(f"Error creating tenant: {e}")
+    return None
+
+async def update_tenant(token, tenant_id, title, profile_id):
+    payload = {
+        "id": {"id": tenant_id, "entityType": "TENANT"},
+        "title": title,
+        "tenantProfileId": {"id": profile_id, "entityType": "TENANT_PROFILE"}
+    }
+    try:
+        response = await get_client().post("/api/tenant", json=payload, headers=get_headers(token))
+        if response.status_code == 200:
+            return response.json()
+    except Exception as e:
+        print(f"Error updating tenant: {e}")
+    return None
+
+async def create_tenant_admin(token, tenant_id, email, first_name, last_name, send_activation_mail=True):
+    return await create_user(token, email, first_name, last_name, "TENANT_ADMIN", tenant_id=tenant_id, send_activation_mail=send_activation_mail)
+
+async def create_user(token, email, first_name, last_name, authority, tenant_id=None, customer_id=None, send_activation_mail=True):
+    payload = build_user_payload(email, first_name, last_name, authority, tenant_id, customer_id)
+    try:
+        response = await get_client().post(
+            "/api/user",
+            params={"sendActivationMail": str(send_activation_mail).lower()},
+            json=payload,
+            headers=get_headers(token),
+        )
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Failed to create user: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Exception creating user: {e}")
+    return None
+
+async def get_activation_link(token, user_id):
+    try:
+        response = await get_client().get(f"/api/user/{user_id}/activationLink", headers=get_headers(token))
+        if response.status_code == 200:
+            return response.text
+        else:
+            print(f"Failed to get activation link: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Error fetching activation link: {e}")
+    return None
+
+async def toggle_user_credentials(token, user_id, enabled):
+    try:
+        response = await get_client().post(
+            f"/api/user/{user_id}/userCredentialsEnabled",
+            params={"userCredentialsEnabled": str(enabled).lower()},
+            headers=get_headers(token),
+        )
+        if response.status_code == 200:
+            return {"success": True}
+        else:
+            print(f"Failed to toggle user credentials: {response.status_code} - {response.text}")
+            return {"success": False, "status_code": response.status_code, "detail": response.text}
+    except Exception as e:
+        print(f"Exception toggling user credentials: {e}")
+        return {"success": False, "status_code": 500, "detail": str(e)}
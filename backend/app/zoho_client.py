@@ -0,0 +1,160 @@
+"""
+Shared HTTP client for Zoho (accounts and Billing API).
+
+One httpx.AsyncClient per process, opened at startup and closed at shutdown,
+so syncs reuse pooled keep-alive connections instead of paying DNS, TCP and
+TLS setup on every call. HTTP/2 is used when the optional `h2` package is
+installed (ZOHO_HTTP2=false turns it off).
+
+List endpoints of the Billing API are paged (page_context.has_more_page);
+iter_list_pages() walks all pages, fetching up to ZOHO_PAGE_CONCURRENCY of
+them at once after the first one showed there are more.
+"""
+import asyncio
+import importlib.util
+import os
+import httpx
+
+MAX_CONNECTIONS = int(os.getenv("ZOHO_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("ZOHO_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("ZOHO_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("ZOHO_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("ZOHO_READ_TIMEOUT", "30"))
+PER_PAGE = 200  # largest page the Billing API hands out
+PAGE_CONCURRENCY = int(os.getenv("ZOHO_PAGE_CONCURRENCY", "4"))
+HTTP2 = os.getenv("ZOHO_HTTP2", "true").lower() == "true" and importlib.util.find_spec("h2") is not None
+
+_client = None
+_client_loop = None
+_org_id = None
+
+
+class ZohoAPIError(Exception):
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+def get_client():
+    """Return the shared AsyncClient, creating it on first use (one per event loop)."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client_loop = loop
+        _client = httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def api_base():
+    """Billing API root of the account's data center."""
+    from .zoho_tokens import zoho_tokens
+    if zoho_tokens.api_domain:  # reported by Zoho with the access token
+        return f"{zoho_tokens.api_domain.rstrip('/')}/billing/v1"
+    zoho_dc = os.getenv("ZOHO_DC", "in")
+    api_domain = "zohoapis.in" if zoho_dc == "in" else "zohoapis.com"
+    return f"https://www.{api_domain}/billing/v1"
+
+async def get_org_id(access_token):
+    """ZOHO_BILLING_ORG_ID / ZOHO_ORG_ID, else the account's first organization (looked up once)."""
+    global _org_id
+    org_id = os.getenv("ZOHO_BILLING_ORG_ID") or os.getenv("ZOHO_ORG_ID") or _org_id
+    if org_id:
+        return org_id
+    print("Org ID not found in env, fetching from Zoho...")
+    try:
+        response = await get_client().get(f"{api_base()}/organizations", headers={"Authorization": f"Zoho-oauthtoken {access_token}"})
+        data = response.json()
+        if response.status_code == 200 and data.get("organizations"):
+            _org_id = data["organizations"][0]["organization_id"]
+            print(f"Fetched Org ID: {_org_id}")
+        else:
+            print(f"Failed to fetch organizations: {data}")
+    except Exception as e:
+        print(f"Error fetching organizations: {e}")
+    return _org_id
+
+def billing_headers(access_token, org_id=None):
+    headers = {
+        "Authorization": f"Zoho-oauthtoken {access_token}",
+        "Content-Type": "application/json"
+    }
+    if org_id:
+        headers["X-com-zoho-subscriptions-organizationid"] = org_id
+    return headers
+
+async def fetch_list_page(path, key, headers, page, per_page=PER_PAGE):
+    """One page of a Billing API listing -> (records, has_more_page)."""
+    from .zoho_tokens import zoho_tokens
+    url = f"{api_base()}/{path}"
+    params = {"page": page, "per_page": per_page}
+    response = await get_client().get(url, headers=headers, params=params)
+    if response.status_code == 401:
+        # Token revoked before its expiry: renew it (once for all workers) and retry once.
+        # `headers` is shared by the pages of a listing, so later pages use the new token.
+        rejected = headers["Authorization"].split(" ", 1)[-1]
+        zoho_tokens.invalidate(rejected)
+        access_token = await zoho_tokens.get_token()
+        if access_token and access_token != rejected:
+            headers["Authorization"] = f"Zoho-oauthtoken {access_token}"
+            response = await get_client().get(url, headers=headers, params=params)
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+    if response.status_code != 200:
+        raise ZohoAPIError(
+            data.get("message") or f"Failed to fetch {path} from Zoho. Status: {response.status_code}, Response: {response.text}",
+            status_code=response.status_code,
+        )
+    return data.get(key, []), bool(data.get("page_context", {}).get("has_more_page"))
+
+async def iter_list_pages(path, key, headers, per_page=PER_PAGE, concurrency=None):
+    """Async generator yielding the records of every page of a listing as each page arrives.
+
+    Page 1 is fetched alone; if it has more, pages 2, 3, ... are requested
+    with up to `concurrency` in flight until a page reports it is the last.
+    Pages after the first are yielded in completion order.
+    """
+    records, has_more = await fetch_list_page(path, key, headers, 1, per_page)
+    yield records
+    if not has_more:
+        return
+
+    concurrency = concurrency or PAGE_CONCURRENCY
+    next_page = 2
+    last_page = None  # known once a page answers has_more_page == False
+    pending = set()
+    try:
+        while True:
+            while len(pending) < concurrency and (last_page is None or next_page <= last_page):
+                pending.add(asyncio.create_task(fetch_list_page(path, key, headers, next_page, per_page), name=str(next_page)))
+                next_page += 1
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda t: int(t.get_name())):
+                records, has_more = task.result()
+                page = int(task.get_name())
+                if not has_more and (last_page is None or page < last_page):
+                    last_page = page
+                    # Requests already sent for pages past the end would only come back empty
+                    for extra in [t for t in pending if int(t.get_name()) > last_page]:
+                        extra.cancel()
+                        pending.discard(extra)
+                if records:
+                    yield records
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,306 @@
+"""
+Zoho OAuth tokens of the billing integration, shared by all worker processes.
+
+The tokens live in the single zoho_tokens row. A worker keeps the access
+token in memory and only looks at the row when its copy is about to expire
+(ZOHO_TOKEN_REFRESH_MARGIN seconds ahead). If the row already holds a fresh
+token, another worker renewed it and that token is used. Otherwise the
+worker claims a lease on the row with a conditional UPDATE; the one whose
+UPDATE matched refreshes at Zoho and writes the new tokens back, everyone
+else polls the row until they appear. Zoho rotates refresh tokens, so
+refreshing from a single place keeps workers from invalidating each other.
+
+Within a process an asyncio lock keeps it to one renewal at a time. The
+accounts data center that answered last is tried first. zoho_token.txt
+(or ZOHO_REFRESH_TOKEN) only seeds the row the first time.
+"""
+import asyncio
+import os
+import socket
+import time
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from . import models, zoho_client
+from .database import SessionLocal
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(__file__))
+REFRESH_TOKEN_PATH = os.path.join(BACKEND_DIR, "zoho_token.txt")
+
+# Refresh this many seconds before the access token expires
+REFRESH_MARGIN = int(os.getenv("ZOHO_TOKEN_REFRESH_MARGIN", "300"))
+# A worker that claimed the refresh has this long before others may take over
+LEASE_SECONDS = int(os.getenv("ZOHO_TOKEN_LEASE", "60"))
+WAIT_POLL = 0.5
+# After a failed renewal callers get no token for this long instead of retrying at once
+FAILURE_BACKOFF = 10
+# Accounts DC tried when the configured one rejects the refresh token
+FALLBACK_DC = "com"
+ROW_ID = 1
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _seed_refresh_token():
+    for path in (REFRESH_TOKEN_PATH, os.path.join(os.getcwd(), "zoho_token.txt")):
+        try:
+            with open(path, "r") as f:
+                token = f.read().strip()
+        except OSError:
+            continue
+        if token:
+            return token
+    return os.getenv("ZOHO_REFRESH_TOKEN") or None
+
+def _snapshot(row):
+    return {
+        "refresh_token": row.refresh_token,
+        "access_token": row.access_token,
+        "expires_at": row.expires_at or 0,
+        "dc": row.dc,
+        "api_domain": row.api_domain,
+    }
+
+def _get_row(db):
+    """The shared row, created (and seeded with the refresh token on disk) on first use."""
+    row = db.get(models.ZohoToken, ROW_ID)
+    if row is None:
+        db.add(models.ZohoToken(id=ROW_ID, refresh_token=_seed_refresh_token(), expires_at=0, lease_until=0))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # another worker created it first
+        row = db.get(models.ZohoToken, ROW_ID)
+    elif not row.refresh_token:
+        row.refresh_token = _seed_refresh_token()
+        db.commit()
+    return row
+
+def _load():
+    db = SessionLocal()
+    try:
+        return _snapshot(_get_row(db))
+    finally:
+        db.close()
+
+def _try_claim():
+    """Take the refresh lease -> snapshot of the row, or None if another worker holds it."""
+    db = SessionLocal()
+    try:
+        _get_row(db)
+        now = time.time()
+        claimed = db.execute(
+            update(models.ZohoToken)
+            .where(models.ZohoToken.id == ROW_ID,
+                   or_(models.ZohoToken.lease_until.is_(None), models.ZohoToken.lease_until < now))
+            .values(lease_owner=WORKER_ID, lease_until=now + LEASE_SECONDS)
+        ).rowcount
+        db.commit()
+        if claimed != 1:
+            return None
+        return _snapshot(db.get(models.ZohoToken, ROW_ID))
+    finally:
+        db.close()
+
+def _save(values, release=False, based_on=None):
+    """Write token fields to the row; release=True also gives up this worker's lease.
+
+    based_on: refresh token the values were obtained with. They are only
+    written while the row still holds it; if Zoho was re-authorised
+    (OAuth callback) in the meantime, the newer tokens in the row are kept.
+    """
+    db = SessionLocal()
+    try:
+        _get_row(db)
+        if values:
+            stmt = update(models.ZohoToken).where(models.ZohoToken.id == ROW_ID)
+            if based_on is not None:
+                stmt = stmt.where(models.ZohoToken.refresh_token == based_on)
+            if db.execute(stmt.values(**values)).rowcount == 0:
+                print("Zoho was re-authorised during the token refresh, keeping the newer tokens")
+        if release:
+            db.execute(
+                update(models.ZohoToken)
+                .where(models.ZohoToken.id == ROW_ID, models.ZohoToken.lease_owner == WORKER_ID)
+                .values(lease_owner=None, lease_until=0)
+            )
+        db.commit()
+        return True
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"Failed to store Zoho tokens: {e}")
+        return False
+    finally:
+        db.close()
+
+
+class ZohoTokenManager:
+    """Zoho access token of this process, renewed through the shared zoho_tokens row."""
+
+    def __init__(self, margin=REFRESH_MARGIN):
+        self.margin = margin
+        self._lock = None
+        self._access_token = None
+        self._expires_at = 0
+        self._rejected = None  # access token Zoho refused; a copy of it in the row is not reused
+        self._retry_at = 0
+        self.dc = None  # accounts DC that issued the current token
+        self.api_domain = None
+        self.last_error = None
+        self.refreshes = 0
+        self.adopted = 0  # tokens renewed by another worker and picked up from the row
+        self.waits = 0
+        self.failures = 0
+
+    def _is_fresh(self):
+        return self._access_token is not None and self._expires_at - self.margin > time.time()
+
+    def _usable(self, snap):
+        return (snap["access_token"] is not None and snap["access_token"] != self._rejected
+                and snap["expires_at"] - self.margin > time.time())
+
+    def _adopt(self, snap):
+        self._access_token = snap["access_token"]
+        self._expires_at = snap["expires_at"]
+        self.dc = snap["dc"]
+        self.api_domain = snap["api_domain"]
+        self.last_error = None
+        self.adopted += 1
+
+    async def get_token(self):
+        """Current access token, or None if Zoho refused to issue one (see last_error)."""
+        if not self._is_fresh() and time.time() >= self._retry_at:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                # Another caller may have renewed (or failed to) while we waited for the lock
+                if not self._is_fresh() and time.time() >= self._retry_at:
+                    await self._renew()
+                    if not self._is_fresh():
+                        self._retry_at = time.time() + FAILURE_BACKOFF
+        return self._access_token if self._expires_at > time.time() else None
+
+    async def _renew(self):
+        give_up_at = time.time() + LEASE_SECONDS + 5
+        waited = False
+        while True:
+            snap = await run_in_threadpool(_load)
+            if self._usable(snap):
+                self._adopt(snap)
+                return
+            claimed = await run_in_threadpool(_try_claim)
+            if claimed is not None:
+                await self._refresh_claimed(claimed)
+                return
+            if time.time() > give_up_at:
+                self.failures += 1
+                self.last_error = "Timed out waiting for another worker to refresh the Zoho token"
+                print(self.last_error)
+                return
+            if not waited:
+                self.waits += 1
+                waited = True
+            await asyncio.sleep(WAIT_POLL)
+
+    async def _refresh_claimed(self, snap):
+        """Refresh at Zoho while holding the lease, store the result and release the lease."""
+        values = {}
+        try:
+            if self._usable(snap):  # renewed between our read and our claim
+                self._adopt(snap)
+                return
+            data, dc = await self._request_tokens(snap["refresh_token"], snap["dc"])
+            if data is None:
+                self.failures += 1
+                self._access_token = None
+                self._expires_at = 0
+                return
+            self._take(data, dc)
+            self.refreshes += 1
+            values = self._row_values(data, dc)
+        finally:
+            await run_in_threadpool(_save, values, True, snap["refresh_token"])
+
+    async def _request_tokens(self, refresh_token, last_dc):
+        """POST the refresh grant, trying the DC that worked last first -> (data, dc) or (None, None)."""
+        if not refresh_token:
+            self.last_error = "No Zoho refresh token configured, connect Zoho via /zoho/auth"
+            print(self.last_error)
+            return None, None
+        dcs = [last_dc, os.getenv("ZOHO_DC", "in"), FALLBACK_DC]
+        data = {}
+        for dc in [dc for i, dc in enumerate(dcs) if dc and dc not in dcs[:i]]:
+            params = {
+                "refresh_token": refresh_token,
+                "client_id": os.getenv("ZOHO_CLIENT_ID"),
+                "client_secret": os.getenv("ZOHO_CLIENT_SECRET"),
+                "grant_type": "refresh_token",
+            }
+            try:
+                response = await zoho_client.get_client().post(f"https://accounts.zoho.{dc}/oauth/v2/token", params=params)
+                data = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                data = {"error": f"Network error connecting to Zoho: {e}"}
+            if "access_token" in data:
+                return data, dc
+            print(f"Zoho token refresh via accounts.zoho.{dc} failed: {data.get('error', data)}")
+        self.last_error = data.get("error", "Unknown error")
+        return None, None
+
+    def _take(self, data, dc):
+        self._access_token = data["access_token"]
+        self._expires_at = time.time() + data.get("expires_in", 3600)
+        self._rejected = None
+        self._retry_at = 0
+        self.dc = dc
+        self.api_domain = data.get("api_domain") or self.api_domain
+        self.last_error = None
+
+    def _row_values(self, data, dc):
+        values = {
+            "access_token": self._access_token,
+            "expires_at": self._expires_at,
+            "dc": dc,
+            "api_domain": self.api_domain,
+        }
+        if data.get("refresh_token"):
+            values["refresh_token"] = data["refresh_token"]
+        return values
+
+    def accept(self, data, dc):
+        """Store a token response of the OAuth callback for all workers; False if it could not be saved."""
+        self._take(data, dc)
+        return _save(self._row_values(data, dc))
+
+    def set_refresh_token(self, token):
+        """Store a new refresh token for all workers; False if it could not be saved."""
+        return _save({"refresh_token": token})
+
+    def invalidate(self, token=None):
+        """Drop the access token after Zoho rejected `token`; the next caller renews it.
+
+        A copy of the rejected token in the shared row is not adopted again.
+        Nothing happens if `token` was already replaced, so concurrent 401s
+        for the same token cause one renewal.
+        """
+        if token is not None and token != self._access_token:
+            return
+        self._rejected = self._access_token
+        self._access_token = None
+        self._expires_at = 0
+
+    def stats(self):
+        return {
+            "cached": self._access_token is not None,
+            "expires_in": max(int(self._expires_at - time.time()), 0) if self._access_token else 0,
+            "dc": self.dc,
+            "refreshes": self.refreshes,
+            "adopted": self.adopted,
+            "waits": self.waits,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+zoho_tokens = ZohoTokenManager()
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# app.thingsboard refuses to import without a TB URL; tests never reach it
+os.environ.setdefault("TB_BASE_URL", "http://tb.local")
+os.environ.setdefault("SECRET_KEY", "test")
+# Never the committed nibiaa_manager.db
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
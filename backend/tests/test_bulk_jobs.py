@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from app import bulk_jobs
+from app.database import Base, SessionLocal, engine
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(bulk_jobs, "PROGRESS_INTERVAL", 0.01)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+async def tb_users(*user_ids):
+    for user_id in user_ids:
+        yield {"id": {"id": user_id, "entityType": "USER"}}
+
+
+def test_failed_items_are_recorded_with_their_id(db):
+    async def handle(job, user):
+        if user["id"]["id"] == "u2":
+            raise RuntimeError("TB unreachable")
+        job.record("succeeded", user["id"]["id"])
+
+    async def run():
+        job = await bulk_jobs.submit(bulk_jobs.BulkJob("test"), tb_users("u1", "u2", "u3"), handle, workers=2)
+        await job.task
+        return job.id
+
+    stored = bulk_jobs.get_job(db, asyncio.run(run()))
+    assert stored["status"] == "done"
+    assert stored["counts"]["succeeded"] == 2
+    assert stored["counts"]["failed"] == 1
+    assert stored["errors"] == [{"id": "u2", "error": "TB unreachable"}]
+
+
+def test_cancel_through_the_database_stops_the_running_job(db):
+    release = asyncio.Event()
+
+    async def handle(job, user):
+        await release.wait()
+
+    async def run():
+        job = await bulk_jobs.submit(bulk_jobs.BulkJob("test"), tb_users("u1"), handle, workers=1)
+        await asyncio.sleep(0.05)
+        # Any worker can take the request: it only flags the row
+        other_session = SessionLocal()
+        try:
+            assert bulk_jobs.cancel(other_session, job.id)
+        finally:
+            other_session.close()
+        await asyncio.wait_for(job.task, 5)
+        return job.id
+
+    job_id = asyncio.run(run())
+    db.expire_all()
+    stored = bulk_jobs.get_job(db, job_id)
+    assert stored["status"] == "cancelled"
+    assert stored["cancel_requested"]
+    assert not bulk_jobs.cancel(db, job_id)
+
+
+def test_jobs_of_a_stopped_worker_are_closed(db):
+    async def handle(job, user):
+        await asyncio.sleep(60)
+
+    async def run():
+        job = await bulk_jobs.submit(bulk_jobs.BulkJob("test"), tb_users("u1"), handle, workers=1)
+        await asyncio.sleep(0.05)
+        await bulk_jobs.stop()
+        return job.id
+
+    stored = bulk_jobs.get_job(db, asyncio.run(run()))
+    assert stored["status"] == "failed"
+    assert stored["detail"] == bulk_jobs.INTERRUPTED
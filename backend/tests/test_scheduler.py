@@ -0,0 +1,57 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from app import models, scheduler
+from app.database import Base, SessionLocal, engine
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(scheduler, "POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(scheduler, "get_system_token", lambda: "system-token")
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    session.query(models.ScheduledJob).delete()
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_jobs_cut_off_by_shutdown_go_back_to_pending(db):
+    started = asyncio.Event()
+
+    async def slow_handler(job, token):
+        started.set()
+        await asyncio.sleep(60)
+        return {}
+    scheduler.register("test_slow", slow_handler)
+
+    async def run():
+        job = scheduler.schedule(db, "test_slow", scheduler.utcnow())
+        scheduler.start()
+        await asyncio.wait_for(started.wait(), 5)
+        await scheduler.stop()
+        return job.id
+
+    job_id = asyncio.run(run())
+    db.expire_all()
+    row = db.get(models.ScheduledJob, job_id)
+    assert row.status == "pending"
+    assert row.claimed_by is None
+
+
+def test_stale_claims_are_requeued_and_run_again(db):
+    async def handler(job, token):
+        return {}
+    scheduler.register("test_quick", handler)
+
+    long_ago = scheduler.utcnow() - timedelta(seconds=scheduler.STALE_AFTER + 60)
+    row = models.ScheduledJob(kind="test_quick", run_at=long_ago, status="running", claimed_by="dead:1", claimed_at=long_ago)
+    db.add(row)
+    db.commit()
+
+    claimed, _ = scheduler._claim_due(db)
+    assert [job["id"] for job in claimed] == [row.id]
+    assert claimed[0]["claimed_by"] == scheduler.WORKER_ID
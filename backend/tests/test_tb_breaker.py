@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+from app import tb_breaker, thingsboard
+from app import thingsboard_async as tb_async
+
+
+@pytest.fixture
+def open_circuit():
+    breaker = tb_breaker.get_breaker(thingsboard.BASE_URL)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    yield breaker
+    breaker.record_success()
+
+
+def test_sync_listings_fail_fast_when_circuit_open(open_circuit):
+    with pytest.raises(tb_breaker.CircuitOpenError):
+        thingsboard.fetch_all_pages("token", "/api/tenants")
+    with pytest.raises(tb_breaker.CircuitOpenError):
+        list(thingsboard.iter_pages("token", "/api/tenants"))
+
+
+def test_async_listings_fail_fast_when_circuit_open(open_circuit):
+    async def run():
+        with pytest.raises(tb_breaker.CircuitOpenError):
+            await tb_async.fetch_all_pages("token", "/api/tenants")
+        with pytest.raises(tb_breaker.CircuitOpenError):
+            async for _ in tb_async.iter_pages("token", "/api/tenants"):
+                pass
+        await tb_async.close_client()
+    asyncio.run(run())
@@ -0,0 +1,41 @@
+from app import tb_memo, thingsboard
+
+
+def test_page_and_enrichment_threads_see_the_request_memo(monkeypatch):
+    seen = []
+
+    def fake_fetch_page(token, url_path, params, page, page_size=None):
+        seen.append(tb_memo.current())
+        return {"data": [{"id": {"id": f"u{page}"}}], "totalPages": 4}
+
+    def fake_enrich_user(token, u, details=True, credentials=True):
+        seen.append(tb_memo.current())
+        return 1, 0, 0
+
+    monkeypatch.setattr(thingsboard, "fetch_page", fake_fetch_page)
+    monkeypatch.setattr(thingsboard, "_enrich_user", fake_enrich_user)
+
+    memo, reset_token = tb_memo.begin()
+    try:
+        users = thingsboard.fetch_all_pages("token", "/api/users", concurrency=3)
+        thingsboard.enrich_users_with_details("token", users, concurrency=3)
+    finally:
+        tb_memo.end(memo, reset_token)
+
+    assert [u["id"]["id"] for u in users] == ["u0", "u1", "u2", "u3"]
+    assert len(seen) == 8
+    assert all(m is memo for m in seen)
+
+
+def test_replayed_responses_keep_their_reason():
+    import requests
+
+    memo = tb_memo.RequestMemo()
+    memo.store("key", 200, [("Content-Type", "application/json")], b"{}", "Everything Fine")
+    request = requests.Request("GET", "http://tb.local/api/tenants").prepare()
+
+    response = thingsboard._TimeoutHTTPAdapter()._replay(request, memo.lookup("key"))
+
+    assert response.status_code == 200
+    assert response.reason == "Everything Fine"
+    assert response.json() == {}
@@ -0,0 +1,82 @@
+import base64
+import json
+import time
+
+import requests
+
+from app import thingsboard
+from app.tb_tokens import SystemTokenManager
+import app.tb_tokens as tb_tokens
+
+
+def make_jwt(sub, exp):
+    payload = base64.urlsafe_b64encode(json.dumps({"sub": sub, "exp": exp}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def unauthorized_response(token):
+    response = requests.Response()
+    response.status_code = 401
+    response.request = requests.Request("GET", "http://tb.local/api/tenants", headers={"X-Authorization": f"Bearer {token}"}).prepare()
+    return response
+
+
+def test_401_for_system_token_forces_fresh_login(monkeypatch):
+    manager = SystemTokenManager("sysadmin@example.com", "secret")
+    monkeypatch.setattr(tb_tokens, "system_tokens", manager)
+
+    issued = []
+
+    def fake_login(username, password):
+        token = make_jwt(username, time.time() + 3600 + len(issued))
+        issued.append(token)
+        return {"token": token, "refreshToken": make_jwt(username, time.time() + 7200)}
+
+    monkeypatch.setattr(thingsboard, "tb_login", fake_login)
+    monkeypatch.setattr(thingsboard, "tb_refresh_token", lambda refresh_token: None)
+
+    first = manager.get_token()
+    assert manager.get_token() == first
+    assert manager.logins == 1
+
+    thingsboard._evict_on_unauthorized(unauthorized_response(first))
+
+    second = manager.get_token()
+    assert second != first
+    assert manager.logins == 2
+
+
+def test_401_for_stale_system_token_keeps_current_one(monkeypatch):
+    manager = SystemTokenManager("sysadmin@example.com", "secret")
+    monkeypatch.setattr(tb_tokens, "system_tokens", manager)
+    monkeypatch.setattr(thingsboard, "tb_login", lambda u, p: {"token": make_jwt(u, time.time() + 3600), "refreshToken": None})
+
+    current = manager.get_token()
+    thingsboard.forget_rejected_token(make_jwt("sysadmin@example.com", time.time() - 10))
+
+    assert manager.get_token() == current
+    assert manager.logins == 1
+
+
+def test_cached_impersonation_token_is_only_reused_by_its_requester(monkeypatch):
+    ta_token = make_jwt("admin@tenant.com", time.time() + 3600)
+    requests_made = []
+
+    def fake_get(url, headers=None, **kwargs):
+        requests_made.append(headers["X-Authorization"])
+        response = requests.Response()
+        if headers["X-Authorization"] == "Bearer sys-token":
+            response.status_code = 200
+            response._content = json.dumps({"token": ta_token}).encode()
+        else:
+            response.status_code = 403
+            response._content = b'{"message": "Forbidden"}'
+        return response
+
+    monkeypatch.setattr(thingsboard.session, "get", fake_get)
+    thingsboard.impersonation_tokens.clear()
+
+    assert thingsboard.get_user_token("sys-token", "ta-1") == ta_token
+    assert thingsboard.get_user_token("sys-token", "ta-1") == ta_token
+    assert thingsboard.get_user_token("customer-token", "ta-1") is None
+    assert requests_made == ["Bearer sys-token", "Bearer customer-token"]
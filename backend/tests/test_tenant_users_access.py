@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app import thingsboard_async as tb_async
+from app.routers import tb
+
+
+@pytest.fixture
+def callers(monkeypatch):
+    accounts = {
+        "sys": {"authority": "SYS_ADMIN"},
+        "admin-t1": {"authority": "TENANT_ADMIN", "tenantId": {"id": "t1"}},
+        "admin-t2": {"authority": "TENANT_ADMIN", "tenantId": {"id": "t2"}},
+        "customer-t1": {"authority": "CUSTOMER_USER", "tenantId": {"id": "t1"}},
+    }
+
+    async def current_user(token):
+        return accounts.get(token)
+    monkeypatch.setattr(tb_async, "get_current_tb_user", current_user)
+    tb.tenant_users_cache._data[("t1", True, True)] = (time.time(), "t1", (["cached user"], None))
+    yield
+    tb.tenant_users_cache.invalidate("t1")
+
+
+@pytest.mark.parametrize("token, status", [("admin-t2", 403), ("customer-t1", 403), ("unknown", 401)])
+def test_cached_tenant_users_need_an_admin_of_the_tenant(callers, token, status):
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(tb._get_tenant_users_cached("t1", token))
+    assert e.value.status_code == status
+
+
+@pytest.mark.parametrize("token", ["sys", "admin-t1"])
+def test_admins_get_the_cached_tenant_users(callers, token):
+    users, _ = asyncio.run(tb._get_tenant_users_cached("t1", token))
+    assert users == ["cached user"]
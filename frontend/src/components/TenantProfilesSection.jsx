@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../context/AuthContext';
+import { fetchAllTenants } from '../utils/tenants';
 import { Edit2, X } from 'lucide-react';
 
 const TenantProfilesSection = () => {
@@ -18,11 +19,11 @@ const TenantProfilesSection = () => {
   const fetchData = async () => {
     setLoading(true);
     try {
-      const [tenantsRes, profilesRes] = await Promise.all([
-        api.get('/tb/tenants'),
+      const [tenantList, profilesRes] = await Promise.all([
+        fetchAllTenants(api),
         api.get('/tb/profiles')
       ]);
-      setTenants(tenantsRes.data || []);
+      setTenants(tenantList);
       setProfiles(profilesRes.data || []);
     } catch (error) {
       console.error("Failed to fetch data", error);
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
+import { fetchAllTenants } from '../utils/tenants';
 
 const CreateTenant = () => {
   const { api, user } = useAuth();
@@ -166,8 +167,7 @@ const CreateTenant = () => {
 
   const fetchExistingTenants = async () => {
     try {
-      const res = await api.get('/tb/tenants');
-      setExistingTenants(res.data || []);
+      setExistingTenants(await fetchAllTenants(api));
     } catch (err) {
       console.error("Failed to fetch existing tenants", err);
     }
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../context/AuthContext';
+import { fetchAllTenants } from '../utils/tenants';
 import { AlertCircle, CheckCircle, X } from 'lucide-react';
 
 const TechnicalDashboard = () => {
@@ -23,10 +24,10 @@ const TechnicalDashboard = () => {
 
   const fetchTenants = async () => {
     try {
-      const res = await api.get('/tb/tenants');
-      setTenants(res.data || []);
-      if (res.data && res.data.length > 0) {
-        setFormData(prev => ({ ...prev, tenantId: res.data[0].id.id }));
+      const list = await fetchAllTenants(api);
+      setTenants(list);
+      if (list.length > 0) {
+        setFormData(prev => ({ ...prev, tenantId: list[0].id.id }));
       }
     } catch (err) {
       console.error("Failed to fetch tenants", err);
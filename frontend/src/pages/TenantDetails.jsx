@@ -12,11 +12,18 @@ const TenantDetails = () => {
     fetchUsers();
   }, [id]);
 
-  const fetchUsers = async () => {
+  const fetchUsers = async (refresh = false) => {
     setLoading(true);
     try {
-      const res = await api.get(`/tb/tenant/${id}/users`);
-      setUsers(res.data || []);
+      // Cheap list first, credential state is filled in by a second batched call.
+      // The backend caches the list briefly; refresh bypasses that cache.
+      const params = { details: false, credentials: false };
+      if (refresh) params.refresh = true;
+      const res = await api.get(`/tb/tenant/${id}/users`, { params });
+      const list = res.data || [];
+      setUsers(list);
+      setLoading(false);
+      fetchCredentials(list);
     } catch (error) {
       console.error("Failed to fetch users", error);
     } finally {
@@ -24,6 +31,27 @@ const TenantDetails = () => {
     }
   };
 
+  // The credentials endpoint accepts at most this many user ids per call (MAX_CREDENTIAL_LOOKUP)
+  const CREDENTIALS_BATCH_SIZE = 1000;
+
+  const fetchCredentials = async (list) => {
+    // Batches are sent one after another; each result is merged as soon as it arrives
+    for (let start = 0; start < list.length; start += CREDENTIALS_BATCH_SIZE) {
+      const batch = list.slice(start, start + CREDENTIALS_BATCH_SIZE);
+      try {
+        const res = await api.post(`/tb/tenant/${id}/users/credentials`, { user_ids: batch.map(u => u.id.id) });
+        const enabledById = res.data || {};
+        setUsers(current => current.map(u =>
+          u.id.id in enabledById
+          ? { ...u, additionalInfo: { ...u.additionalInfo, userCredentialsEnabled: enabledById[u.id.id] } }
+          : u
+        ));
+      } catch (error) {
+        console.error("Failed to fetch credential status", error);
+      }
+    }
+  };
+
   const toggleStatus = async (userId, currentStatus) => {
     try {
       // Optimistic update
@@ -52,7 +80,7 @@ const TenantDetails = () => {
         <div className="mt-4 flex sm:ml-4 sm:mt-0 gap-3">
           <button 
             className="inline-flex items-center rounded-md bg-white px-3 py-2 text-sm font-semibold text-slate-900 shadow-sm ring-1 ring-inset ring-slate-300 hover:bg-slate-50"
-            onClick={fetchUsers}
+            onClick={() => fetchUsers(true)}
           >
             Refresh
           </button>
@@ -12,6 +12,8 @@ const Tenants = () => {
   const [zohoTenants, setZohoTenants] = useState([]);
   const [currentPage, setCurrentPage] = useState(1);
   const [itemsPerPage, setItemsPerPage] = useState(10);
+  const [totalElements, setTotalElements] = useState(0);
+  const [totalPages, setTotalPages] = useState(0);
 
   // Modal States
   const [selectedTenantId, setSelectedTenantId] = useState(null);
@@ -40,7 +42,6 @@ const Tenants = () => {
         setIsLoadingData(true);
         try {
           await Promise.all([
-            fetchTenants(),
             fetchProjects(),
             fetchUsers(),
             fetchZohoTenants(),
@@ -56,6 +57,13 @@ const Tenants = () => {
     }
   }, [tbToken, user]);
 
+  // Tenants are paged server-side, so a page change is a new request
+  useEffect(() => {
+    if (tbToken && user) {
+      fetchTenants();
+    }
+  }, [tbToken, user, currentPage, itemsPerPage]);
+
   const fetchProfiles = async () => {
     try {
       const res = await api.get('/tb/profiles');
@@ -179,10 +187,15 @@ const Tenants = () => {
     }
   };
 
-  const fetchTenants = async () => {
+  const fetchTenants = async (refresh = false) => {
     try {
-      const res = await api.get('/tb/tenants');
-      setTenants(res.data || []);
+      // Paged server-side; refresh re-syncs the backend's tenant table from ThingsBoard first
+      const params = { page: currentPage - 1, pageSize: itemsPerPage };
+      if (refresh) params.refresh = true;
+      const res = await api.get('/tb/tenants', { params });
+      setTenants(res.data.data || []);
+      setTotalElements(res.data.totalElements || 0);
+      setTotalPages(res.data.totalPages || 0);
     } catch (error) {
       console.error("Failed to fetch tenants", error);
     }
@@ -221,11 +234,10 @@ const Tenants = () => {
     return u ? `${u.email}` : id;
   };
 
-  // Pagination Logic
-  const indexOfLastItem = currentPage * itemsPerPage;
-  const indexOfFirstItem = indexOfLastItem - itemsPerPage;
-  const currentTenants = tenants.slice(indexOfFirstItem, indexOfLastItem);
-  const totalPages = Math.ceil(tenants.length / itemsPerPage);
+  // Pagination Logic (the backend returns only the current page)
+  const indexOfFirstItem = (currentPage - 1) * itemsPerPage;
+  const indexOfLastItem = indexOfFirstItem + tenants.length;
+  const currentTenants = tenants;
 
   const paginate = (pageNumber) => setCurrentPage(pageNumber);
 
@@ -243,7 +255,7 @@ const Tenants = () => {
       <div className="bg-white shadow-sm ring-1 ring-slate-900/5 sm:rounded-xl overflow-hidden flex-1 flex flex-col">
         <div className="border-b border-slate-200 px-4 py-5 sm:px-6 flex justify-between items-center bg-slate-50">
           <h3 className="text-base font-semibold leading-6 text-slate-900">
-            Tenants Overview <span className="ml-2 inline-flex items-center rounded-full bg-blue-50 px-2 py-1 text-xs font-medium text-primary ring-1 ring-inset ring-blue-700/10">{tenants.length}</span>
+            Tenants Overview <span className="ml-2 inline-flex items-center rounded-full bg-blue-50 px-2 py-1 text-xs font-medium text-primary ring-1 ring-inset ring-blue-700/10">{totalElements}</span>
           </h3>
           <div className="flex gap-2">
             {/* Check role for Create rights if necessary, or assume Layout handles route access */}
@@ -258,7 +270,7 @@ const Tenants = () => {
             )}
             <button
               className="inline-flex items-center rounded bg-white px-2 py-1 text-sm font-semibold text-slate-900 shadow-sm ring-1 ring-inset ring-slate-300 hover:bg-slate-50"
-              onClick={() => { fetchTenants(); fetchProjects(); fetchZohoTenants(); }}
+              onClick={() => { fetchTenants(true); fetchProjects(); fetchZohoTenants(); }}
               title="Refresh List"
             >
               <RefreshCw className="h-4 w-4 mr-1" />
@@ -444,7 +456,7 @@ const Tenants = () => {
             <div className="hidden sm:flex sm:flex-1 sm:items-center sm:justify-between">
               <div>
                 <p className="text-sm text-slate-900">
-                  Showing <span className="font-medium">{indexOfFirstItem + 1}</span> to <span className="font-medium">{Math.min(indexOfLastItem, tenants.length)}</span> of <span className="font-medium">{tenants.length}</span> results
+                  Showing <span className="font-medium">{indexOfFirstItem + 1}</span> to <span className="font-medium">{indexOfLastItem}</span> of <span className="font-medium">{totalElements}</span> results
                 </p>
               </div>
               <div className="flex items-center gap-4">
@@ -1,5 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { useAuth } from '../context/AuthContext';
+import { fetchAllTenants } from '../utils/tenants';
 import { Trash2, UserPlus, Building, AlertCircle, Pencil, X, Plus } from 'lucide-react';
 
 const UserManagement = () => {
@@ -43,8 +44,7 @@ const UserManagement = () => {
 
   const fetchTenants = async () => {
     try {
-      const res = await api.get('/tb/tenants');
-      setTenants(res.data || []);
+      setTenants(await fetchAllTenants(api));
     } catch (error) {
       console.error("Failed to fetch tenants", error);
     }
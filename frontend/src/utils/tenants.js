@@ -0,0 +1,13 @@
+// /tb/tenants is paged; walk every page for pickers that need the full list
+export const fetchAllTenants = async (api, pageSize = 1000) => {
+  const tenants = [];
+  let page = 0;
+  let hasNext = true;
+  while (hasNext) {
+    const res = await api.get('/tb/tenants', { params: { page, pageSize } });
+    tenants.push(...(res.data.data || []));
+    hasNext = res.data.hasNext;
+    page += 1;
+  }
+  return tenants;
+};